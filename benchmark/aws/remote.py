@@ -1,10 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
 from os import error
+import os
 from fabric import Connection, ThreadingGroup as Group
 from fabric.exceptions import GroupException
 from paramiko import RSAKey
 from paramiko.ssh_exception import PasswordRequiredException, SSHException
 from os.path import basename, splitext
-from time import sleep
+from time import sleep, time
 from math import ceil
 from os.path import join
 import subprocess
@@ -13,6 +16,8 @@ from benchmark.config import Committee, Key, NodeParameters, BenchParameters, Co
 from benchmark.utils import BenchError, Print, PathMaker, progress_bar
 from benchmark.commands import CommandMaker
 from benchmark.logs import LogParser, ParseError
+from benchmark.monitor import LogMonitor, MonitorError
+from benchmark.search import SaturationSearch
 from aws.instance import InstanceManager
 
 
@@ -30,6 +35,16 @@ class ExecutionError(Exception):
 
 
 class Bench:
+    READY_TIMEOUT = 60  # s, on top of the clients' own synchronization delay.
+    PROFILE_TIMEOUT = 120  # s, for the profilers to write their samples.
+    MAX_TRANSFERS = 16  # Maximum number of concurrent file transfers.
+    BINARIES = ['node', 'client']
+
+    # Build the binaries on every host ('remote'), once on this machine
+    # ('local', which must match the hosts' OS), or once on the first host
+    # ('builder'). The last two then ship the binaries to the other hosts.
+    BUILD_MODES = ['remote', 'local', 'builder']
+
     def __init__(self, ctx):
         self.manager = InstanceManager.make()
         self.settings = self.manager.settings
@@ -40,6 +55,23 @@ class Bench:
             self.connect = ctx.connect_kwargs
         except (IOError, PasswordRequiredException, SSHException) as e:
             raise BenchError('Failed to load SSH key', e)
+        self.connections = {}
+        self.configured = None  # The hosts holding the current config files.
+        self.regions = {}  # The region of each host.
+
+    def _connection(self, host):
+        # Reuse a single SSH connection per host.
+        if host not in self.connections:
+            self.connections[host] = Connection(
+                host, user='ubuntu', connect_kwargs=self.connect
+            )
+        return self.connections[host]
+
+    def _connections(self, hosts):
+        # Cache the connections of all hosts before the transfer threads
+        # look them up. Connecting (the SSH handshake) is left to the first
+        # use of each connection, so the threads still do it concurrently.
+        return [self._connection(x) for x in hosts]
 
     def _check_stderr(self, output):
         if isinstance(output, dict):
@@ -69,6 +101,11 @@ class Bench:
             # This is missing from the Rocksdb installer (needed for Rocksdb).
             'sudo apt-get install -y clang',
 
+            # Install perf and allow it to profile the nodes (see `profile`).
+            'sudo apt-get -y install linux-tools-common linux-tools-generic linux-tools-$(uname -r)',
+            'echo "kernel.perf_event_paranoid = 1" | sudo tee /etc/sysctl.d/99-perf.conf',
+            'sudo sysctl --system',
+
             # Clone the repo.
             f'(git clone {self.settings.repo_url} || (cd {self.settings.repo_name} ; git pull))'
         ]
@@ -100,6 +137,7 @@ class Bench:
         hosts = self.manager.hosts()
         if sum(len(x) for x in hosts.values()) < nodes:
             return []
+        self.regions = {x: k for k, v in hosts.items() for x in v}
 
         # Select the hosts in different data centers.
         ordered = zip(*hosts.values())
@@ -109,11 +147,97 @@ class Bench:
     def _background_run(self, host, command, log_file):
         name = splitext(basename(log_file))[0]
         cmd = f'tmux new -d -s "{name}" "{command} |& tee {log_file}"'
-        c = Connection(host, user='ubuntu', connect_kwargs=self.connect)
-        output = c.run(cmd, hide=True)
+        output = self._connection(host).run(cmd, hide=True)
         self._check_stderr(output)
 
-    def _update(self, hosts):
+    def _sample(self, host, command, bench_parameters, log_file):
+        # Record the resources used by the process running the command.
+        cmd = CommandMaker.run_sampler(
+            f'./{basename(PathMaker.sampler_script())}',
+            bench_parameters.sample_interval,
+            command
+        )
+        self._background_run(host, cmd, log_file)
+
+    def _profile(self, hosts, commands, bench_parameters, profile):
+        # Sample the call stacks of the selected nodes during the benchmark.
+        for i in profile:
+            cmd = CommandMaker.profile(
+                commands[i], bench_parameters.duration, PathMaker.perf_data_file(i)
+            )
+            self._background_run(hosts[i], cmd, PathMaker.perf_log_file(i))
+
+    def _collect_profiles(self, hosts, profile, timeout):
+        g = Group(
+            *[hosts[i] for i in profile], user='ubuntu', connect_kwargs=self.connect
+        )
+        deadline = time() + timeout
+        while True:
+            output = g.run(CommandMaker.check_profiled(), hide=True, warn=True)
+            if all(x.ok for x in output.values()):
+                break
+            if time() > deadline:
+                raise TimeoutError(f'Profilers still running after {timeout} s')
+            sleep(1)
+
+        # Symbolize the samples on the hosts, where the binaries are.
+        for i in profile:
+            cmd = CommandMaker.profile_script(
+                PathMaker.perf_data_file(i), PathMaker.profile_file(i)
+            )
+            self._connection(hosts[i]).run(cmd, hide=True)
+
+    def _reader(self, hosts):
+        # Poll the text appended to the remote logs since the last call.
+        offsets = {}
+
+        def tail(i, host):
+            c = self._connection(host)
+            chunks = []
+            for filename in [
+                PathMaker.node_log_file(i), PathMaker.client_log_file(i)
+            ]:
+                offset = offsets.get(filename, 0)
+                output = c.run(CommandMaker.tail(filename, offset), hide=True)
+                offsets[filename] = offset + len(output.stdout.encode())
+                chunks += [(filename, output.stdout)]
+            return chunks
+
+        def read():
+            with ThreadPoolExecutor(max_workers=self.MAX_TRANSFERS) as executor:
+                futures = [executor.submit(tail, i, x) for i, x in enumerate(hosts)]
+                return [x for y in futures for x in y.result()]
+        return read
+
+    def _wait_ready(self, hosts, timeout):
+        # Poll the logs until all clients are sending and a block committed.
+        g = Group(*hosts, user='ubuntu', connect_kwargs=self.connect)
+        deadline = time() + timeout
+        while time() < deadline:
+            output = g.run(CommandMaker.check_ready(), hide=True)
+            counts = [[int(x) for x in y.stdout.split()] for y in output.values()]
+            started, committed = [sum(x) for x in zip(*counts)]
+            if started == len(hosts) and committed > 0:
+                return
+            sleep(1)
+        raise TimeoutError(f'Testbed not ready after {timeout:,.0f} s')
+
+    def _update(self, hosts, build='remote'):
+        assert build in self.BUILD_MODES
+        if build == 'remote':
+            self._build(hosts)
+            return
+
+        if build == 'local':
+            Print.info('Compiling the binaries locally...')
+            self._compile()
+            origin = PathMaker.binary_path()
+        else:
+            self._build(hosts[:1])
+            origin = self._fetch_binaries(hosts[0])
+        self._ship_binaries(hosts, origin)
+
+    def _build(self, hosts):
         Print.info(
             f'Updating {len(hosts)} nodes (branch "{self.settings.branch}")...'
         )
@@ -123,20 +247,65 @@ class Bench:
             f'(cd {self.settings.repo_name} && git pull -f)',
             'source $HOME/.cargo/env',
             f'(cd {self.settings.repo_name}/node && {CommandMaker.compile()})',
-            CommandMaker.alias_binaries(
-                f'./{self.settings.repo_name}/target/release/'
-            )
+            CommandMaker.alias_binaries(self._remote_binary_path())
         ]
         g = Group(*hosts, user='ubuntu', connect_kwargs=self.connect)
         g.run(' && '.join(cmd), hide=True)
 
-    def _config(self, hosts, node_parameters):
-        Print.info('Generating configuration files...')
+    def _remote_binary_path(self):
+        return f'./{self.settings.repo_name}/target/release/'
 
-        # Cleanup all local configuration files.
-        cmd = CommandMaker.cleanup()
-        subprocess.run([cmd], shell=True, stderr=subprocess.DEVNULL)
+    def _fetch_binaries(self, host):
+        # Download the binaries compiled on the builder host.
+        Print.info(f'Fetching the binaries from {host}...')
+        origin = PathMaker.build_path()
+        os.makedirs(origin, exist_ok=True)
+        c = self._connection(host)
+        for binary in self.BINARIES:
+            c.get(
+                join(self._remote_binary_path(), binary),
+                local=join(origin, binary)
+            )
+        return origin
+
+    def _ship_binaries(self, hosts, origin):
+        # Upload the binaries to all hosts whose copy differs from ours.
+        digests = {}
+        for binary in self.BINARIES:
+            with open(join(origin, binary), 'rb') as f:
+                digests[binary] = sha256(f.read()).hexdigest()
+
+        destination = self._remote_binary_path()
+        g = Group(*hosts, user='ubuntu', connect_kwargs=self.connect)
+        output = g.run(CommandMaker.hash_binaries(destination), hide=True)
+        outdated = []
+        for connection, result in output.items():
+            remote = dict(
+                (basename(y), x) for x, y in
+                (line.split() for line in result.stdout.splitlines())
+            )
+            if any(remote.get(k) != v for k, v in digests.items()):
+                outdated += [connection.host]
+
+        Print.info(
+            f'Uploading the binaries to {len(outdated)} nodes '
+            f'({len(hosts) - len(outdated)} already up to date)...'
+        )
+
+        def upload(host):
+            c = self._connection(host)
+            for binary in self.BINARIES:
+                c.put(join(origin, binary), destination)
 
+        self._connections(outdated)
+        with ThreadPoolExecutor(max_workers=self.MAX_TRANSFERS) as executor:
+            futures = [executor.submit(upload, x) for x in outdated]
+            for future in progress_bar(futures, prefix='Uploading binaries:'):
+                future.result()
+
+        g.run(CommandMaker.alias_binaries(destination), hide=True)
+
+    def _compile(self):
         # Recompile the latest code.
         cmd = CommandMaker.compile().split()
         subprocess.run(cmd, check=True, cwd=PathMaker.node_crate_path())
@@ -145,13 +314,37 @@ class Bench:
         cmd = CommandMaker.alias_binaries(PathMaker.binary_path())
         subprocess.run([cmd], shell=True)
 
+    def _generate_keys(self, filenames):
+        # Run the key generators concurrently.
+        processes = [
+            subprocess.Popen(CommandMaker.generate_key(x).split())
+            for x in filenames
+        ]
+        for p in processes:
+            if p.wait() != 0:
+                raise subprocess.CalledProcessError(p.returncode, p.args)
+        return [Key.from_file(x) for x in filenames]
+
+    def _config(self, hosts, node_parameters):
+        # Reuse the committee and keys already uploaded to these hosts (eg.
+        # when sweeping over input rates); only the stores need cleaning.
+        if self.configured == hosts:
+            Print.info('Reusing configuration files...')
+            cmd = f'{CommandMaker.clean_stores()} || true'
+            g = Group(*hosts, user='ubuntu', connect_kwargs=self.connect)
+            g.run(cmd, hide=True)
+            return Committee.load(PathMaker.committee_file())
+
+        Print.info('Generating configuration files...')
+        self.configured = None
+
+        # Cleanup all local configuration files.
+        cmd = CommandMaker.cleanup()
+        subprocess.run([cmd], shell=True, stderr=subprocess.DEVNULL)
+
         # Generate configuration files.
-        keys = []
         key_files = [PathMaker.key_file(i) for i in range(len(hosts))]
-        for filename in key_files:
-            cmd = CommandMaker.generate_key(filename).split()
-            subprocess.run(cmd, check=True)
-            keys += [Key.from_file(filename)]
+        keys = self._generate_keys(key_files)
 
         names = [x.name for x in keys]
         consensus_addr = [f'{x}:{self.settings.consensus_port}' for x in hosts]
@@ -167,17 +360,24 @@ class Bench:
         g = Group(*hosts, user='ubuntu', connect_kwargs=self.connect)
         g.run(cmd, hide=True)
 
-        # Upload configuration files.
-        progress = progress_bar(hosts, prefix='Uploading config files:')
-        for i, host in enumerate(progress):
-            c = Connection(host, user='ubuntu', connect_kwargs=self.connect)
+        # Upload configuration files concurrently.
+        def upload(i, host):
+            c = self._connection(host)
             c.put(PathMaker.committee_file(), '.')
             c.put(PathMaker.key_file(i), '.')
             c.put(PathMaker.parameters_file(), '.')
+            c.put(PathMaker.sampler_script(), '.')
+
+        self._connections(hosts)
+        with ThreadPoolExecutor(max_workers=self.MAX_TRANSFERS) as executor:
+            futures = [executor.submit(upload, i, x) for i, x in enumerate(hosts)]
+            for future in progress_bar(futures, prefix='Uploading config files:'):
+                future.result()
 
+        self.configured = list(hosts)
         return committee
 
-    def _run_single(self, hosts, rate, bench_parameters, node_parameters, debug=False):
+    def _run_single(self, hosts, rate, bench_parameters, node_parameters, debug=False, profile=[], live=False):
         Print.info('Booting testbed...')
 
         # Kill any potentially unfinished run and delete logs.
@@ -191,7 +391,7 @@ class Bench:
         rate_share = ceil(rate / committee.size())  # Take faults into account.
         timeout = node_parameters.timeout_delay
         client_logs = [PathMaker.client_log_file(i) for i in range(len(hosts))]
-        for host, addr, log_file in zip(hosts, addresses, client_logs):
+        for i, (host, addr, log_file) in enumerate(zip(hosts, addresses, client_logs)):
             cmd = CommandMaker.run_client(
                 addr,
                 bench_parameters.tx_size,
@@ -200,12 +400,18 @@ class Bench:
                 nodes=addresses
             )
             self._background_run(host, cmd, log_file)
+            self._sample(
+                host, cmd, bench_parameters, PathMaker.client_resources_file(i)
+            )
 
         # Run the nodes.
         key_files = [PathMaker.key_file(i) for i in range(len(hosts))]
         dbs = [PathMaker.db_path(i) for i in range(len(hosts))]
         node_logs = [PathMaker.node_log_file(i) for i in range(len(hosts))]
-        for host, key_file, db, log_file in zip(hosts, key_files, dbs, node_logs):
+        commands = []
+        for i, (host, key_file, db, log_file) in enumerate(
+            zip(hosts, key_files, dbs, node_logs)
+        ):
             cmd = CommandMaker.run_node(
                 key_file,
                 PathMaker.committee_file(),
@@ -214,44 +420,93 @@ class Bench:
                 debug=debug
             )
             self._background_run(host, cmd, log_file)
+            self._sample(
+                host, cmd, bench_parameters, PathMaker.node_resources_file(i)
+            )
+            commands += [cmd]
 
-        # Wait for the nodes to synchronize
+        # Wait for the nodes to synchronize and start committing.
         Print.info('Waiting for the nodes to synchronize...')
-        sleep(2 * node_parameters.timeout_delay / 1000)
+        timeout = 2 * node_parameters.timeout_delay / 1000
+        self._wait_ready(hosts, timeout + self.READY_TIMEOUT)
 
         # Wait for all transactions to be processed.
         duration = bench_parameters.duration
-        for _ in progress_bar(range(20), prefix=f'Running benchmark ({duration} sec):'):
-            sleep(ceil(duration / 20))
+        self._profile(hosts, commands, bench_parameters, profile)
+        if live:
+            Print.info(f'Running benchmark ({duration} sec)...')
+            LogMonitor(
+                self._reader(hosts),
+                bench_parameters.tx_size,
+                node_parameters.timeout_delay
+            ).run(duration)
+        else:
+            for _ in progress_bar(range(20), prefix=f'Running benchmark ({duration} sec):'):
+                sleep(duration / 20)
+        if profile:
+            Print.info(f'Collecting the profiles of {len(profile)} node(s)...')
+            self._collect_profiles(hosts, profile, self.PROFILE_TIMEOUT)
         self.kill(hosts=hosts, delete_logs=False)
 
-    def _logs(self, hosts, faults):
+    def _logs(self, hosts, faults, profile=[], bench={}):
         # Delete local logs (if any).
         cmd = CommandMaker.clean_logs()
         subprocess.run([cmd], shell=True, stderr=subprocess.DEVNULL)
 
-        # Download log files.
-        progress = progress_bar(hosts, prefix='Downloading logs:')
-        for i, host in enumerate(progress):
-            c = Connection(host, user='ubuntu', connect_kwargs=self.connect)
-            c.get(PathMaker.node_log_file(i), local=PathMaker.node_log_file(i))
-            c.get(
-                PathMaker.client_log_file(i), local=PathMaker.client_log_file(i)
-            )
+        # Compress the log files on the remote machines.
+        g = Group(*hosts, user='ubuntu', connect_kwargs=self.connect)
+        g.run(CommandMaker.compress_logs(), hide=True)
+
+        # Download log files concurrently (one transfer per connection).
+        def download(i, host):
+            c = self._connection(host)
+            for filename in [
+                PathMaker.node_log_file(i),
+                PathMaker.client_log_file(i),
+                PathMaker.node_resources_file(i),
+                PathMaker.client_resources_file(i)
+            ] + ([PathMaker.profile_file(i)] if i in profile else []):
+                filename = PathMaker.compressed_file(filename)
+                c.get(filename, local=filename)
+
+        self._connections(hosts)
+        with ThreadPoolExecutor(max_workers=self.MAX_TRANSFERS) as executor:
+            futures = [executor.submit(download, i, x) for i, x in enumerate(hosts)]
+            for future in progress_bar(futures, prefix='Downloading logs:'):
+                future.result()
 
         # Parse logs and return the parser.
         Print.info('Parsing logs and computing performance...')
-        return LogParser.process(PathMaker.logs_path(), faults=faults)
+        regions = [self.regions.get(x, 'unknown') for x in hosts]
+        return LogParser.process(
+            PathMaker.logs_path(), faults=faults, regions=regions, hosts=hosts,
+            bench=bench
+        )
 
-    def run(self, bench_parameters_dict, node_parameters_dict, debug=False):
+    def run(self, bench_parameters_dict, node_parameters_dict, debug=False, build='remote', profile=[], live=False):
+        # The nodes listed in `profile` (by index) are profiled with `perf`
+        # during every run; their flame graphs are written to plots/. The
+        # `live` mode follows the logs during every run and aborts the runs
+        # that are broken.
         assert isinstance(debug, bool)
+        assert isinstance(live, bool)
+        assert build in self.BUILD_MODES
+        assert isinstance(profile, list)
         Print.heading('Starting remote benchmark')
+        self.configured = None
         try:
             bench_parameters = BenchParameters(bench_parameters_dict)
             node_parameters = NodeParameters(node_parameters_dict)
         except ConfigError as e:
             raise BenchError('Invalid nodes or bench parameters', e)
 
+        nodes = min(bench_parameters.nodes) - bench_parameters.faults
+        if any(not isinstance(x, int) or not 0 <= x < nodes for x in profile):
+            raise BenchError(
+                'Invalid profile option',
+                ConfigError(f'Profiled nodes must be in [0, {nodes})')
+            )
+
         # Select which hosts to use.
         selected_hosts = self._select_hosts(bench_parameters)
         if not selected_hosts:
@@ -260,42 +515,79 @@ class Bench:
 
         # Update nodes.
         try:
-            self._update(selected_hosts)
+            self._update(selected_hosts, build)
         except (GroupException, ExecutionError) as e:
             e = FabricError(e) if isinstance(e, GroupException) else e
             raise BenchError('Failed to update nodes', e)
+        except (subprocess.SubprocessError, OSError, SSHException) as e:
+            raise BenchError('Failed to update nodes', e)
+
+        # Compile the binaries used to generate the configuration files.
+        try:
+            if build != 'local':
+                self._compile()
+        except subprocess.SubprocessError as e:
+            raise BenchError('Failed to compile the binaries', e)
 
         # Run benchmarks.
         for n in bench_parameters.nodes:
+            hosts = selected_hosts[:n]
+            if bench_parameters.max_latency is not None:
+                Print.heading(f'\nSearching saturation point of {n} nodes')
+                SaturationSearch(
+                    bench_parameters.rate[0],
+                    bench_parameters.max_latency,
+                    bench_parameters.tolerance
+                ).run(lambda r: self._run_point(
+                    hosts, r, bench_parameters, node_parameters, debug, profile,
+                    live
+                ))
+                continue
+
             for r in bench_parameters.rate:
-                Print.heading(f'\nRunning {n} nodes (input rate: {r:,} tx/s)')
-                hosts = selected_hosts[:n]
-
-                # Upload all configuration files.
-                try:
-                    self._config(hosts, node_parameters)
-                except (subprocess.SubprocessError, GroupException) as e:
-                    e = FabricError(e) if isinstance(e, GroupException) else e
-                    Print.error(BenchError('Failed to configure nodes', e))
-                    continue
-
-                # Do not boot faulty nodes.
-                faults = bench_parameters.faults
-                hosts = hosts[:n-faults]
-
-                # Run the benchmark.
-                for i in range(bench_parameters.runs):
-                    Print.heading(f'Run {i+1}/{bench_parameters.runs}')
-                    try:
-                        self._run_single(
-                            hosts, r, bench_parameters, node_parameters, debug
-                        )
-                        self._logs(hosts, faults).print(PathMaker.result_file(
-                            n, r, bench_parameters.tx_size, faults
-                        ))
-                    except (subprocess.SubprocessError, GroupException, ParseError) as e:
-                        self.kill(hosts=hosts)
-                        if isinstance(e, GroupException):
-                            e = FabricError(e)
-                        Print.error(BenchError('Benchmark failed', e))
-                        continue
+                self._run_point(
+                    hosts, r, bench_parameters, node_parameters, debug, profile,
+                    live
+                )
+
+    def _run_point(self, hosts, rate, bench_parameters, node_parameters, debug, profile=[], live=False):
+        # Run all the runs of a single (nodes, rate) point and return their
+        # metrics.
+        n = len(hosts)
+        Print.heading(f'\nRunning {n} nodes (input rate: {rate:,} tx/s)')
+
+        # Upload all configuration files.
+        try:
+            self._config(hosts, node_parameters)
+        except (subprocess.SubprocessError, GroupException) as e:
+            e = FabricError(e) if isinstance(e, GroupException) else e
+            Print.error(BenchError('Failed to configure nodes', e))
+            return []
+
+        # Do not boot faulty nodes.
+        faults = bench_parameters.faults
+        hosts = hosts[:n-faults]
+
+        # Run the benchmark.
+        metrics = []
+        for i in range(bench_parameters.runs):
+            Print.heading(f'Run {i+1}/{bench_parameters.runs}')
+            try:
+                self._run_single(
+                    hosts, rate, bench_parameters, node_parameters, debug,
+                    profile, live
+                )
+                parser = self._logs(
+                    hosts, faults, profile, bench_parameters.json
+                )
+                parser.print(PathMaker.result_file(
+                    n, rate, bench_parameters.tx_size, faults
+                ))
+                metrics += [parser.metrics()]
+            except (subprocess.SubprocessError, GroupException, ParseError, TimeoutError, MonitorError) as e:
+                self.kill(hosts=hosts)
+                if isinstance(e, GroupException):
+                    e = FabricError(e)
+                Print.error(BenchError('Benchmark failed', e))
+                continue
+        return metrics
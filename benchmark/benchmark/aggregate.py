@@ -1,11 +1,13 @@
-from re import search
-from collections import defaultdict
+from re import findall, search
+from collections import Counter, defaultdict
 from statistics import mean, stdev
 from glob import glob
 from copy import deepcopy
 from os.path import join
 import os
 
+from benchmark.database import ResultsDB
+from benchmark.records import RunRecords
 from benchmark.utils import PathMaker
 
 
@@ -32,6 +34,11 @@ class Setup:
     def __hash__(self):
         return hash(str(self))
 
+    @classmethod
+    def from_record(cls, record):
+        setup = record['setup']
+        return cls(setup['nodes'], setup['rate'], setup['tx_size'], setup['faults'])
+
     @classmethod
     def from_str(cls, raw):
         nodes = int(search(r'.* Committee size: (\d+)', raw).group(1))
@@ -42,23 +49,40 @@ class Setup:
 
 
 class Result:
-    def __init__(self, mean_tps, mean_latency, std_tps=0, std_latency=0):
+    def __init__(self, mean_tps, mean_latency, std_tps=0, std_latency=0,
+                 percentiles={}):
         self.mean_tps = mean_tps
         self.mean_latency = mean_latency
         self.std_tps = std_tps
         self.std_latency = std_latency
+        self.percentiles = percentiles
 
     def __str__(self):
+        percentiles = ''.join(
+            f' Latency {k}: {v} ms\n' for k, v in self.percentiles.items()
+        )
         return(
             f' TPS: {self.mean_tps} +/- {self.std_tps} tx/s\n'
             f' Latency: {self.mean_latency} +/- {self.std_latency} ms\n'
+            f'{percentiles}'
         )
 
+    @classmethod
+    def from_record(cls, record):
+        metrics = record['metrics']
+        tps = round(metrics['end_to_end_tps'])
+        latency = round(metrics['end_to_end_latency'])
+        percentiles = metrics.get('end_to_end_percentiles', {})
+        percentiles = {k: round(v) for k, v in percentiles.items()}
+        return cls(tps, latency, percentiles=percentiles)
+
     @classmethod
     def from_str(cls, raw):
         tps = int(search(r'.* End-to-end TPS: (\d+)', raw).group(1))
         latency = int(search(r'.* End-to-end latency: (\d+)', raw).group(1))
-        return cls(tps, latency)
+        percentiles = findall(r'.* End-to-end latency ([^ ]+): (\d+)', raw)
+        percentiles = {k: int(v) for k, v in percentiles}
+        return cls(tps, latency, percentiles=percentiles)
 
     @classmethod
     def aggregate(cls, results):
@@ -69,36 +93,107 @@ class Result:
         mean_latency = round(mean([x.mean_latency for x in results]))
         std_tps = round(stdev([x.mean_tps for x in results]))
         std_latency = round(stdev([x.mean_latency for x in results]))
-        return cls(mean_tps, mean_latency, std_tps, std_latency)
+
+        # Average the tail latency over the runs that report it.
+        keys = [k for x in results for k in x.percentiles]
+        percentiles = {
+            k: round(mean([x.percentiles[k] for x in results if k in x.percentiles]))
+            for k in dict.fromkeys(keys)
+        }
+        return cls(mean_tps, mean_latency, std_tps, std_latency, percentiles)
 
 
 class LogAggregator:
-    def __init__(self, max_latencies):
+    def __init__(self, max_latencies, **filters):
         assert isinstance(max_latencies, list)
         assert all(isinstance(x, int) for x in max_latencies)
 
         self.max_latencies = max_latencies
 
-        data = ''
-        for filename in glob(join(PathMaker.results_path(), '*.txt')):
-            with open(filename, 'r') as f:
-                data += f.read()
+        # Query the results database (filters select on the indexed setup
+        # columns, ie. nodes, rate, tx_size, and faults).
+        with ResultsDB(PathMaker.results_db()) as db:
+            self._import_runs(db)
+            runs = db.records(**filters)
 
         records = defaultdict(list)
-        for chunk in data.replace(',', '').split('SUMMARY')[1:]:
-            if chunk:
-                records[Setup.from_str(chunk)] += [Result.from_str(chunk)]
+        for record in runs:
+            records[Setup.from_record(record)] += [Result.from_record(record)]
 
         self.records = {k: Result.aggregate(v) for k, v in records.items()}
 
+    @staticmethod
+    def _signature(record):
+        # What the aggregation keeps of a run. The text summaries have no
+        # timestamp, so this is how they are matched with recorded runs.
+        return Setup.from_record(record), str(Result.from_record(record))
+
+    def _import_runs(self, db):
+        # Import the runs recorded before the database: those of the JSON
+        # records and of the text summaries. The database tracks the mtime
+        # of every imported file, so a file is only imported again once it
+        # changed.
+        def changed(filename):
+            mtime = os.path.getmtime(filename)
+            return mtime if db.imported(filename) != mtime else None
+
+        jsonl = PathMaker.records_file()
+        sources = [jsonl] if os.path.exists(jsonl) else []
+        sources += sorted(glob(join(PathMaker.results_path(), '*.txt')))
+        sources = {x: changed(x) for x in sources}
+        sources = {k: v for k, v in sources.items() if v is not None}
+        if not sources:
+            return
+
+        runs = db.records()
+        known = {(x['timestamp'], str(Setup.from_record(x))) for x in runs}
+        signatures = Counter(self._signature(x) for x in runs)
+
+        # The JSON records of the runs also in the database have the same
+        # timestamp.
+        if jsonl in sources:
+            for record in RunRecords(jsonl).load():
+                key = record['timestamp'], str(Setup.from_record(record))
+                if key not in known:
+                    db.insert_record(record)
+                    known.add(key)
+                    signatures[self._signature(record)] += 1
+            db.mark_imported(jsonl, sources.pop(jsonl))
+
+        # Every run printed a text summary, so skip the summaries of the
+        # runs already in the database.
+        for filename, timestamp in sources.items():
+            with open(filename, 'r') as f:
+                data = f.read()
+            for chunk in data.replace(',', '').split('SUMMARY')[1:]:
+                setup, result = Setup.from_str(chunk), Result.from_str(chunk)
+                record = {
+                    'timestamp': timestamp,
+                    'setup': {x: getattr(setup, x) for x in ResultsDB.SETUP},
+                    'parameters': {},
+                    'metrics': {
+                        'end_to_end_tps': result.mean_tps,
+                        'end_to_end_latency': result.mean_latency,
+                        'end_to_end_percentiles': result.percentiles
+                    },
+                }
+                signature = self._signature(record)
+                if signatures[signature] > 0:
+                    signatures[signature] -= 1
+                else:
+                    db.insert_record(record)
+            db.mark_imported(filename, timestamp)
+
+    def results(self):
+        return [
+            self._print_latency(), self._print_tps(), self._print_robustness()
+        ]
+
     def print(self):
         if not os.path.exists(PathMaker.plots_path()):
             os.makedirs(PathMaker.plots_path())
 
-        results = [
-            self._print_latency(), self._print_tps(), self._print_robustness()
-        ]
-        for name, records in results:
+        for name, records in self.results():
             for setup, values in records.items():
                 data = '\n'.join(
                     f' Variable value: X={x}\n{y}' for x, y in values
@@ -0,0 +1,122 @@
+import pickle
+from hashlib import blake2b
+from json import JSONDecodeError, dump, load
+from os import listdir, makedirs, remove, replace, stat
+from os.path import abspath, exists, getsize, join
+from time import time
+
+
+class CacheError(Exception):
+    pass
+
+
+class ParseCache:
+    ''' On-disk cache of the intermediate results of the LogParser (the
+    per-file output of its workers), so that re-analysing logs only parses
+    the files that are new or changed. The entries are keyed by the hash of
+    the file contents; an index maps every known path (with its size and
+    modification time) to that hash, so unchanged files are found without
+    being read. Entries are pickled (the bulk of a result is arrays, which
+    pickle as raw bytes) and evicted in LRU order once the cache exceeds
+    `max_size` bytes. '''
+
+    INDEX = 'index.json'
+
+    def __init__(self, directory, max_size=2 * 2**30):
+        assert isinstance(directory, str)
+        assert isinstance(max_size, int) and max_size > 0
+        self.directory = directory
+        self.max_size = max_size
+        self.index = {'paths': {}, 'entries': {}}
+        try:
+            with open(join(directory, self.INDEX), 'r') as f:
+                index = load(f)
+            if all(isinstance(index.get(x), dict) for x in self.index):
+                self.index = index
+        except (OSError, JSONDecodeError):
+            pass  # Start with an empty cache.
+
+    @staticmethod
+    def _hash(filename):
+        h = blake2b(digest_size=16)
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def key(self, kind, filename):
+        ''' The key of the result of parsing `filename` as `kind` (which
+        should change with the parsing code). '''
+        path = abspath(filename)
+        s = stat(path)
+        known = self.index['paths'].get(path)
+        if known is not None and known[:2] == [s.st_size, s.st_mtime_ns]:
+            digest = known[2]
+        else:
+            digest = self._hash(path)
+            self.index['paths'][path] = [s.st_size, s.st_mtime_ns, digest]
+        return f'{kind}-{digest}'
+
+    def _entry_file(self, key):
+        return join(self.directory, f'{key}.pickle')
+
+    def get(self, key):
+        ''' Return the cached result, or None. '''
+        if key not in self.index['entries']:
+            return None
+        try:
+            with open(self._entry_file(key), 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            del self.index['entries'][key]
+            return None
+        self.index['entries'][key]['used'] = time()
+        return result
+
+    def put(self, key, result):
+        try:
+            makedirs(self.directory, exist_ok=True)
+            filename = self._entry_file(key)
+            with open(f'{filename}.tmp', 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            replace(f'{filename}.tmp', filename)
+            self.index['entries'][key] = {
+                'size': getsize(filename), 'used': time()
+            }
+        except (OSError, pickle.PicklingError) as e:
+            raise CacheError(f'Failed to cache parse result: {e}')
+
+    def size(self):
+        return sum(x['size'] for x in self.index['entries'].values())
+
+    def _evict(self):
+        # Drop the least recently used entries (and the paths that map to
+        # them) until the cache fits.
+        entries = self.index['entries']
+        total = self.size()
+        for key in sorted(entries, key=lambda x: entries[x]['used']):
+            if total <= self.max_size:
+                break
+            total -= entries.pop(key)['size']
+            if exists(self._entry_file(key)):
+                remove(self._entry_file(key))
+        digests = {x.split('-')[-1] for x in entries}
+        self.index['paths'] = {
+            k: v for k, v in self.index['paths'].items() if v[2] in digests
+        }
+
+    def save(self):
+        ''' Evict the old entries and write the index. '''
+        try:
+            makedirs(self.directory, exist_ok=True)
+            self._evict()
+            # Remove the entries left over by a failed save.
+            for x in listdir(self.directory):
+                if x.endswith('.pickle') and x[:-7] not in self.index['entries']:
+                    remove(join(self.directory, x))
+            filename = join(self.directory, self.INDEX)
+            with open(f'{filename}.tmp', 'w') as f:
+                dump(self.index, f)
+            replace(f'{filename}.tmp', filename)
+        except OSError as e:
+            raise CacheError(f'Failed to save parse cache: {e}')
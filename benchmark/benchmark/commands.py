@@ -11,6 +11,10 @@ class CommandMaker:
             f'rm -r .db-* ; rm .*.json ; mkdir -p {PathMaker.results_path()}'
         )
 
+    @staticmethod
+    def clean_stores():
+        return 'rm -r .db-*'
+
     @staticmethod
     def clean_logs():
         return f'rm -r {PathMaker.logs_path()} ; mkdir -p {PathMaker.logs_path()}'
@@ -46,8 +50,97 @@ class CommandMaker:
                 f'--rate {rate} --timeout {timeout} {nodes}')
 
     @staticmethod
-    def kill():
-        return 'tmux kill-server'
+    def run_sampler(script, interval, command):
+        assert isinstance(script, str)
+        assert isinstance(interval, (int, float)) and interval > 0
+        assert isinstance(command, str)
+        return f'python3 {script} --interval {interval} {command}'
+
+    @staticmethod
+    def profile(command, duration, output):
+        # Sample the call stacks of the process running the command.
+        assert isinstance(command, str)
+        assert isinstance(duration, int) and duration > 0
+        assert isinstance(output, str)
+        return (
+            f'perf record -F 99 -g -o {output} '
+            f'-p $(pgrep -n -x -f \'{command}\') -- sleep {duration}'
+        )
+
+    @staticmethod
+    def profile_script(data, output):
+        assert isinstance(data, str)
+        assert isinstance(output, str)
+        return f'perf script -i {data} > {output} 2> /dev/null ; rm -f {data}'
+
+    @staticmethod
+    def check_profiled(socket=None):
+        # Fails while a profiler is still writing its samples.
+        tmux = ' '.join(CommandMaker.tmux(socket))
+        return f'! {tmux} ls 2> /dev/null | grep -q "^perf-"'
+
+    @staticmethod
+    def tail(filename, offset):
+        # Print the file from the given byte offset.
+        assert isinstance(filename, str)
+        assert isinstance(offset, int) and offset >= 0
+        return f'tail -c +{offset + 1} {filename} 2> /dev/null || true'
+
+    @staticmethod
+    def run_relay(script, config):
+        assert isinstance(script, str)
+        assert isinstance(config, str)
+        return f'python3 {script} {config}'
+
+    @staticmethod
+    def compress_logs():
+        return f'gzip -f {join(PathMaker.logs_path(), "*.log")}'
+
+    @staticmethod
+    def check_ready():
+        # Count the clients that started sending transactions and the nodes
+        # that committed at least one block.
+        clients = join(PathMaker.logs_path(), 'client-*.log')
+        nodes = join(PathMaker.logs_path(), 'node-*.log')
+        return (
+            f'grep -l "Start sending transactions" {clients} 2> /dev/null | wc -l ; '
+            f'grep -l "Committed B" {nodes} 2> /dev/null | wc -l'
+        )
+
+    @staticmethod
+    def kill(socket=None):
+        return f'{" ".join(CommandMaker.tmux(socket))} kill-server'
+
+    @staticmethod
+    def tmux(socket=None):
+        # Each testbed may use its own tmux server (and socket).
+        assert socket is None or isinstance(socket, str)
+        return ['tmux'] if socket is None else ['tmux', '-L', socket]
+
+    @staticmethod
+    def pin(command, cpus):
+        assert isinstance(command, str)
+        assert isinstance(cpus, str)
+        return f'taskset -c {cpus} {command}'
+
+    @staticmethod
+    def cgroup(command, cpus, memory=None):
+        # Run the command in its own (cgroup v2) scope; the cpuset and memory
+        # controllers must be delegated to the user.
+        assert isinstance(command, str)
+        assert isinstance(cpus, str)
+        assert memory is None or (isinstance(memory, int) and memory > 0)
+        memory = f'-p MemoryMax={memory}M -p MemorySwapMax=0 ' if memory else ''
+        return (
+            f'systemd-run --user --scope --quiet -p AllowedCPUs={cpus} '
+            f'{memory}{command}'
+        )
+
+    @staticmethod
+    def hash_binaries(origin):
+        assert isinstance(origin, str)
+        node, client = join(origin, 'node'), join(origin, 'client')
+        return f'mkdir -p {origin} ; sha256sum {node} {client} 2> /dev/null || true'
 
     @staticmethod
     def alias_binaries(origin):
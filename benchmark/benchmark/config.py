@@ -128,6 +128,27 @@ class BenchParameters:
             self.faults = int(json['faults'])
             self.duration = int(json['duration'])
             self.runs = int(json['runs']) if 'runs' in json else 1
+            self.sample_interval = float(json.get('sample_interval', 1))
+
+            # Setting a latency bound searches for the saturation point
+            # (starting from the first input rate) instead of a sweep.
+            max_latency = json.get('max_latency')
+            self.max_latency = int(max_latency) if max_latency else None
+            tolerance = json.get('tolerance', max(1, self.rate[0] // 10))
+            self.tolerance = int(tolerance)
+
+            # Local benchmarks only: give every node and client dedicated
+            # CPUs ('taskset' or 'cgroup'), and cap the nodes' memory (MB,
+            # cgroup only).
+            self.isolation = json.get('isolation')
+            self.client_cpus = int(json.get('client_cpus', 1))
+            node_memory = json.get('node_memory')
+            self.node_memory = int(node_memory) if node_memory else None
+
+            # Local benchmarks only: emulate a WAN between the nodes (see
+            # WanEmulator for the parameters).
+            self.wan = json.get('wan')
+            self.json = json
         except KeyError as e:
             raise ConfigError(f'Malformed bench parameters: missing key {e}')
 
@@ -137,6 +158,33 @@ class BenchParameters:
         if min(self.nodes) <= self.faults:
             raise ConfigError('There should be more nodes than faults')
 
+        if self.max_latency is not None and self.max_latency <= 0:
+            raise ConfigError('Invalid max latency')
+
+        if self.max_latency is not None and self.rate[0] <= 0:
+            raise ConfigError('The search needs a positive input rate')
+
+        if self.tolerance <= 0:
+            raise ConfigError('Invalid search tolerance')
+
+        if self.sample_interval <= 0:
+            raise ConfigError('Invalid resources sampling interval')
+
+        if self.isolation not in [None, 'taskset', 'cgroup']:
+            raise ConfigError('Isolation must be "taskset" or "cgroup"')
+
+        if self.client_cpus <= 0:
+            raise ConfigError('Invalid number of CPUs per client')
+
+        if self.node_memory is not None and self.isolation != 'cgroup':
+            raise ConfigError('Capping the memory requires the cgroup isolation')
+
+        if self.node_memory is not None and self.node_memory <= 0:
+            raise ConfigError('Invalid memory cap')
+
+        if self.wan is not None and not isinstance(self.wan, dict):
+            raise ConfigError('Invalid WAN parameters')
+
 
 class PlotParameters:
     def __init__(self, json):
@@ -0,0 +1,195 @@
+import sqlite3
+import subprocess
+from json import dumps, loads
+from os import makedirs
+from os.path import dirname
+from time import time
+
+
+class DatabaseError(Exception):
+    pass
+
+
+class ResultsDB:
+    ''' Embedded (SQLite) store holding one row per benchmark run: the
+    setup (indexed), the headline metrics, and the rest of the run's record
+    (see LogParser.record). It also tracks the legacy result files that the
+    LogAggregator imported. '''
+
+    SETUP = ['nodes', 'rate', 'tx_size', 'faults']
+    METRICS = [
+        'duration',
+        'consensus_tps',
+        'consensus_bps',
+        'consensus_latency',
+        'end_to_end_tps',
+        'end_to_end_bps',
+        'end_to_end_latency',
+        'steady_state_tps',
+        'view_changes',
+        'stall_time',
+        'recovery_time',
+        'lost_tx',
+    ]
+    # The fields of a record stored as a whole in the `context` column.
+    CONTEXT = ['bench', 'hosts', 'regions', 'start', 'end']
+
+    def __init__(self, filename):
+        assert isinstance(filename, str)
+        metrics = ',\n'.join(f'{x} REAL' for x in self.METRICS)
+        try:
+            if dirname(filename):
+                makedirs(dirname(filename), exist_ok=True)
+            self.connection = sqlite3.connect(filename)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.executescript(
+                'CREATE TABLE IF NOT EXISTS runs (\n'
+                'id INTEGER PRIMARY KEY AUTOINCREMENT,\n'
+                'nodes INTEGER NOT NULL,\n'
+                'rate INTEGER NOT NULL,\n'
+                'tx_size INTEGER NOT NULL,\n'
+                'faults INTEGER NOT NULL,\n'
+                'timestamp REAL NOT NULL,\n'
+                'commit_hash TEXT,\n'
+                f'{metrics},\n'
+                'parameters TEXT NOT NULL,\n'
+                'record TEXT NOT NULL,\n'
+                'context TEXT\n'
+                ');\n'
+                'CREATE INDEX IF NOT EXISTS runs_setup '
+                'ON runs (nodes, rate, tx_size, faults);\n'
+                'CREATE TABLE IF NOT EXISTS imports (\n'
+                'path TEXT PRIMARY KEY,\n'
+                'mtime REAL NOT NULL\n'
+                ');\n'
+            )
+            self._migrate()
+        except (OSError, sqlite3.Error) as e:
+            raise DatabaseError(f'Failed to open results database: {e}')
+
+    def _migrate(self):
+        # Add the metrics columns introduced after the database was created.
+        existing = [
+            x['name'] for x in
+            self.connection.execute('PRAGMA table_info(runs)').fetchall()
+        ]
+        for column in (x for x in self.METRICS if x not in existing):
+            self.connection.execute(f'ALTER TABLE runs ADD COLUMN {column} REAL')
+        if 'context' not in existing:
+            self.connection.execute('ALTER TABLE runs ADD COLUMN context TEXT')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def insert(self, setup, parameters, metrics, commit_hash=None, timestamp=None, context={}):
+        ''' Record a run. The `setup` dict holds the indexed configuration
+        (nodes, rate, tx_size, faults), `parameters` the node parameters,
+        and `metrics` every metric computed by the LogParser. '''
+        assert isinstance(setup, dict)
+        assert isinstance(context, dict)
+        assert isinstance(parameters, dict)
+        assert isinstance(metrics, dict)
+
+        timestamp = timestamp if timestamp else time()
+        columns = self.SETUP + ['timestamp', 'commit_hash'] + self.METRICS
+        columns += ['parameters', 'record', 'context']
+        values = [setup[x] for x in self.SETUP] + [timestamp, commit_hash]
+        values += [metrics.get(x) for x in self.METRICS]
+        values += [dumps(parameters), dumps(metrics), dumps(context)]
+        try:
+            cursor = self.connection.execute(
+                f'INSERT INTO runs ({", ".join(columns)}) '
+                f'VALUES ({", ".join("?" for _ in columns)})',
+                values
+            )
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            raise DatabaseError(f'Failed to record run: {e}')
+
+    def runs(self, **filters):
+        ''' Return all runs matching the filters. Each filter is either a
+        single value or a list of accepted values for a setup column. '''
+        assert all(x in self.SETUP for x in filters)
+        clauses, values = [], []
+        for column, value in filters.items():
+            value = value if isinstance(value, list) else [value]
+            clauses += [f'{column} IN ({", ".join("?" for _ in value)})']
+            values += value
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        try:
+            rows = self.connection.execute(
+                f'SELECT * FROM runs {where} ORDER BY id', values
+            ).fetchall()
+        except sqlite3.Error as e:
+            raise DatabaseError(f'Failed to query runs: {e}')
+
+        runs = []
+        for row in rows:
+            run = dict(row)
+            run['parameters'] = loads(run['parameters'])
+            run['record'] = loads(run['record'])
+            run['context'] = loads(run['context']) if run['context'] else {}
+            runs += [run]
+        return runs
+
+    def insert_record(self, record):
+        ''' Record a run from its record (see LogParser.record). '''
+        return self.insert(
+            record['setup'],
+            record['parameters'],
+            record['metrics'],
+            commit_hash=record.get('commit_hash'),
+            timestamp=record['timestamp'],
+            context={x: record[x] for x in self.CONTEXT if x in record}
+        )
+
+    def records(self, **filters):
+        ''' Return the records of all runs matching the filters. '''
+        return [{
+            'timestamp': x['timestamp'],
+            'commit_hash': x['commit_hash'],
+            'setup': {k: x[k] for k in self.SETUP},
+            'parameters': x['parameters'],
+            **x['context'],
+            'metrics': x['record'],
+        } for x in self.runs(**filters)]
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+
+    def imported(self, path):
+        ''' The mtime of the file `path` when it was last imported, if ever. '''
+        try:
+            row = self.connection.execute(
+                'SELECT mtime FROM imports WHERE path = ?', [path]
+            ).fetchone()
+        except sqlite3.Error as e:
+            raise DatabaseError(f'Failed to query imports: {e}')
+        return row['mtime'] if row else None
+
+    def mark_imported(self, path, mtime):
+        try:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO imports (path, mtime) VALUES (?, ?)',
+                [path, mtime]
+            )
+        except sqlite3.Error as e:
+            raise DatabaseError(f'Failed to record import: {e}')
+
+    @staticmethod
+    def current_commit():
+        try:
+            output = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'],
+                capture_output=True, text=True, check=True
+            )
+            return output.stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
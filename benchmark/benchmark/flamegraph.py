@@ -0,0 +1,108 @@
+from collections import Counter
+from html import escape
+from re import compile
+from zlib import crc32
+
+# The symbol of a `perf script` frame, without its offset and library.
+FRAME = compile(r'^\s*[0-9a-f]+ (.*?)(?:\+0x[0-9a-f]+)? \(.*\)$')
+
+
+class FlameGraph:
+    ''' Fold the call stacks sampled by `perf record` (and printed with
+    `perf script`) and render them as an SVG flame graph. '''
+
+    WIDTH = 1200  # px
+    FRAME_HEIGHT = 16  # px
+    MIN_WIDTH = 0.5  # px, narrower frames are not drawn.
+
+    def __init__(self, stacks):
+        assert isinstance(stacks, Counter)
+        self.stacks = stacks
+
+    @classmethod
+    def from_perf_script(cls, f):
+        stacks, frames, command = Counter(), [], None
+        for line in f:
+            if not line.strip():
+                if command is not None:
+                    stacks[';'.join([command] + frames[::-1])] += 1
+                frames, command = [], None
+            elif not line[0].isspace():
+                command = line.split()[0]
+            else:
+                match = FRAME.match(line.rstrip())
+                frames += [match.group(1) if match else '[unknown]']
+        if command is not None:
+            stacks[';'.join([command] + frames[::-1])] += 1
+        return cls(stacks)
+
+    def print_folded(self, filename):
+        assert isinstance(filename, str)
+        with open(filename, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+
+    def _tree(self):
+        # Merge the stacks into a tree of {name: [count, children]}.
+        root = [0, {}]
+        for stack, count in self.stacks.items():
+            node = root
+            node[0] += count
+            for frame in stack.split(';'):
+                node = node[1].setdefault(frame, [0, {}])
+                node[0] += count
+        return root
+
+    def _color(self, name):
+        x = crc32(name.encode())
+        return f'rgb({205 + x % 50},{(x >> 8) % 180},{(x >> 16) % 55})'
+
+    def print_svg(self, filename, title=''):
+        assert isinstance(filename, str)
+        root = self._tree()
+        total = max(root[0], 1)
+        scale = self.WIDTH / total
+
+        frames, depth = [], 0
+        stack, x = [], 0
+        for name, node in sorted(root[1].items()):
+            stack.append((name, node, 0, x))
+            x += node[0] * scale
+        while stack:
+            name, node, level, x = stack.pop()
+            width = node[0] * scale
+            if width < self.MIN_WIDTH:
+                continue
+            depth = max(depth, level + 1)
+            frames += [(name, node[0], level, x, width)]
+            child_x = x
+            for child, value in sorted(node[1].items()):
+                stack.append((child, value, level + 1, child_x))
+                child_x += value[0] * scale
+
+        height = (depth + 2) * self.FRAME_HEIGHT
+        elements = []
+        for name, count, level, x, width in frames:
+            y = height - (level + 1) * self.FRAME_HEIGHT
+            label = escape(name)
+            text = label if width > 7 * len(name) else ''
+            elements += [
+                f'<g><title>{label} ({count:,} samples, '
+                f'{100 * count / total:.2f}%)</title>'
+                f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" '
+                f'height="{self.FRAME_HEIGHT - 1}" fill="{self._color(name)}"/>'
+                f'<text x="{x + 3:.1f}" y="{y + self.FRAME_HEIGHT - 4}">'
+                f'{text}</text></g>'
+            ]
+
+        with open(filename, 'w') as f:
+            f.write(
+                '<?xml version="1.0" standalone="no"?>\n'
+                f'<svg version="1.1" width="{self.WIDTH}" height="{height}" '
+                'xmlns="http://www.w3.org/2000/svg" '
+                'font-family="Verdana" font-size="12">\n'
+                f'<text x="{self.WIDTH / 2}" y="{self.FRAME_HEIGHT}" '
+                f'text-anchor="middle" font-size="14">{escape(title)}</text>\n'
+                + '\n'.join(elements) +
+                '\n</svg>\n'
+            )
@@ -1,120 +1,377 @@
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from math import ceil
-from os.path import basename, join, splitext
-from time import sleep
+from os import makedirs
+from os.path import abspath, basename, join, splitext
+from time import sleep, time
 
 from benchmark.commands import CommandMaker
 from benchmark.config import Key, LocalCommittee, NodeParameters, BenchParameters, ConfigError
 from benchmark.logs import LogParser, ParseError
+from benchmark.monitor import LocalReader, LogMonitor, MonitorError
+from benchmark.placement import Placement
+from benchmark.search import SaturationSearch
 from benchmark.utils import Print, BenchError, PathMaker
+from benchmark.wan import WanEmulator
 
 
 class LocalBench:
     BASE_PORT = 7000
+    PORTS_PER_TESTBED = 1_000
+    READY_TIMEOUT = 30  # s, on top of the clients' own synchronization delay.
+    PROFILE_TIMEOUT = 60  # s, for the profilers to write their samples.
 
-    def __init__(self, bench_parameters_dict, node_parameters_dict):
+    def __init__(self, bench_parameters_dict, node_parameters_dict, testbed=None, cpus=None):
+        # Several testbeds may run side by side on the same machine. Each
+        # numbered testbed gets its own port range (after the one of the
+        # default testbed), working directory, tmux server, and results
+        # summaries, and may be pinned to a CPU set (eg. '0-7').
+        assert testbed is None or (isinstance(testbed, int) and testbed >= 0)
+        assert cpus is None or isinstance(cpus, str)
         try:
             self.bench_parameters = BenchParameters(bench_parameters_dict)
             self.node_parameters = NodeParameters(node_parameters_dict)
         except ConfigError as e:
             raise BenchError('Invalid nodes or bench parameters', e)
 
+        self.testbed, self.cpus = testbed, cpus
+        if testbed is None:
+            self.path, self.socket, self.base_port = '.', None, self.BASE_PORT
+        else:
+            self.path = PathMaker.testbed_path(testbed)
+            self.socket = f'testbed-{testbed}'
+            self.base_port = \
+                self.BASE_PORT + (testbed + 1) * self.PORTS_PER_TESTBED
+        self.emulator = None  # The WAN emulator of the current committee.
+
     def __getattr__(self, attr):
         return getattr(self.bench_parameters, attr)
 
-    def _background_run(self, command, log_file):
+    def _shell(self, command, **kwargs):
+        # Run a shell command from the testbed's working directory.
+        return subprocess.run([command], shell=True, cwd=self.path, **kwargs)
+
+    def _background_run(self, command, log_file, placed=False):
         name = splitext(basename(log_file))[0]
+        if self.cpus is not None and not placed:
+            command = CommandMaker.pin(command, self.cpus)
         cmd = f'{command} 2> {log_file}'
-        subprocess.run(['tmux', 'new', '-d', '-s', name, cmd], check=True)
+        subprocess.run(
+            CommandMaker.tmux(self.socket) + [
+                'new', '-d', '-s', name, '-c', abspath(self.path), cmd
+            ],
+            check=True
+        )
+
+    def _sample(self, command, log_file):
+        # Record the resources used by the process running the command.
+        cmd = CommandMaker.run_sampler(
+            abspath(PathMaker.sampler_script()), self.sample_interval, command
+        )
+        self._background_run(cmd, log_file)
+
+    def _profile(self, commands, profile):
+        # Sample the call stacks of the selected nodes during the benchmark.
+        for i in profile:
+            cmd = CommandMaker.profile(
+                commands[i], self.duration, PathMaker.perf_data_file(i)
+            )
+            self._background_run(cmd, PathMaker.perf_log_file(i))
+
+    def _collect_profiles(self, profile, timeout):
+        deadline = time() + timeout
+        cmd = CommandMaker.check_profiled(self.socket)
+        while self._shell(cmd).returncode != 0:
+            if time() > deadline:
+                raise TimeoutError(f'Profilers still running after {timeout} s')
+            sleep(0.5)
+
+        # Symbolize the samples while the binaries are at hand.
+        for i in profile:
+            cmd = CommandMaker.profile_script(
+                PathMaker.perf_data_file(i), PathMaker.profile_file(i)
+            )
+            self._shell(cmd, check=True)
 
     def _kill_nodes(self):
         try:
-            cmd = CommandMaker.kill().split()
+            cmd = CommandMaker.kill(self.socket).split()
             subprocess.run(cmd, stderr=subprocess.DEVNULL)
         except subprocess.SubprocessError as e:
             raise BenchError('Failed to kill testbed', e)
 
-    def run(self, debug=False):
+    def _generate_keys(self, filenames):
+        # Run the key generators concurrently.
+        processes = [
+            subprocess.Popen(CommandMaker.generate_key(x).split(), cwd=self.path)
+            for x in filenames
+        ]
+        for p in processes:
+            if p.wait() != 0:
+                raise subprocess.CalledProcessError(p.returncode, p.args)
+        return [Key.from_file(join(self.path, x)) for x in filenames]
+
+    def _wait_ready(self, clients, timeout):
+        # Poll the logs until all clients are sending and a block committed.
+        deadline = time() + timeout
+        while time() < deadline:
+            cmd = CommandMaker.check_ready()
+            output = self._shell(
+                cmd, capture_output=True, text=True, check=True
+            )
+            started, committed = [int(x) for x in output.stdout.split()]
+            if started == clients and committed > 0:
+                return
+            sleep(0.5)
+        raise TimeoutError(f'Testbed not ready after {timeout:,.0f} s')
+
+    def _compile(self):
+        makedirs(self.path, exist_ok=True)
+
+        # Recompile the latest code.
+        cmd = CommandMaker.compile().split()
+        subprocess.run(cmd, check=True, cwd=PathMaker.node_crate_path())
+
+        # Create alias for the client and nodes binary.
+        cmd = CommandMaker.alias_binaries(abspath(PathMaker.binary_path()))
+        self._shell(cmd)
+
+    def _config(self, nodes):
+        # Cleanup all files.
+        cmd = f'{CommandMaker.clean_logs()} ; {CommandMaker.cleanup()}'
+        self._shell(cmd, stderr=subprocess.DEVNULL)
+        sleep(0.5) # Removing the store may take time.
+
+        # Generate configuration files.
+        key_files = [PathMaker.key_file(i) for i in range(nodes)]
+        keys = self._generate_keys(key_files)
+
+        names = [x.name for x in keys]
+        committee = LocalCommittee(names, self.base_port)
+        committee.print(join(self.path, PathMaker.committee_file()))
+
+        # Route the traffic between nodes through the WAN emulator's relays,
+        # which listen on the ports following the committee's.
+        self.emulator = None
+        if self.wan is not None:
+            ports = 3 * nodes + 2 * nodes**2
+            if self.testbed is not None and ports > self.PORTS_PER_TESTBED:
+                raise ConfigError(f'The WAN emulation needs {ports} ports')
+            self.emulator = WanEmulator(
+                self.wan, committee, self.base_port + 3 * nodes
+            )
+            self.emulator.print(
+                [join(self.path, PathMaker.node_committee_file(i))
+                 for i in range(nodes)],
+                join(self.path, PathMaker.relay_config_file())
+            )
+
+        self.node_parameters.print(join(self.path, PathMaker.parameters_file()))
+        return committee
+
+    def _run_single(self, committee, rate, debug=False, profile=[], live=False):
+        # Cleanup the logs and stores of any previous run.
+        cmd = f'{CommandMaker.clean_logs()} ; {CommandMaker.clean_stores()}'
+        self._shell(cmd, stderr=subprocess.DEVNULL)
+        sleep(0.5) # Removing the store may take time.
+
+        # Do not boot faulty nodes.
+        nodes = committee.size() - self.faults
+
+        # Give every node and client dedicated CPUs (if requested).
+        placement = None
+        if self.isolation is not None:
+            placement = Placement(
+                self.isolation,
+                nodes,
+                cpus=self.cpus,
+                client_cpus=self.client_cpus,
+                node_memory=self.node_memory
+            )
+
+        # Run the clients (they will wait for the nodes to be ready).
+        addresses = committee.front
+        rate_share = ceil(rate / nodes)
+        timeout = self.node_parameters.timeout_delay
+        client_logs = [PathMaker.client_log_file(i) for i in range(nodes)]
+        for i, (addr, log_file) in enumerate(zip(addresses, client_logs)):
+            cmd = CommandMaker.run_client(
+                addr,
+                self.tx_size,
+                rate_share,
+                timeout
+            )
+            if placement is not None:
+                self._background_run(placement.client(i, cmd), log_file, True)
+            else:
+                self._background_run(cmd, log_file)
+            self._sample(cmd, PathMaker.client_resources_file(i))
+
+        # Run the WAN emulator (if any).
+        if self.emulator is not None:
+            cmd = CommandMaker.run_relay(
+                abspath(PathMaker.relay_script()), PathMaker.relay_config_file()
+            )
+            self._background_run(cmd, PathMaker.relay_log_file())
+
+        # Run the nodes. Their files are given by absolute path so that the
+        # command lines (that the sampler and profiler look for) differ from
+        # one testbed to the next.
+        path = abspath(self.path)
+        key_files = [join(path, PathMaker.key_file(i)) for i in range(nodes)]
+        dbs = [join(path, PathMaker.db_path(i)) for i in range(nodes)]
+        node_logs = [PathMaker.node_log_file(i) for i in range(nodes)]
+        commands = []
+        for i, (key_file, db, log_file) in enumerate(zip(key_files, dbs, node_logs)):
+            committee_file = PathMaker.node_committee_file(i) \
+                if self.emulator is not None else PathMaker.committee_file()
+            cmd = CommandMaker.run_node(
+                key_file,
+                join(path, committee_file),
+                db,
+                join(path, PathMaker.parameters_file()),
+                debug=debug
+            )
+            if placement is not None:
+                self._background_run(placement.node(i, cmd), log_file, True)
+            else:
+                self._background_run(cmd, log_file)
+            self._sample(cmd, PathMaker.node_resources_file(i))
+            commands += [cmd]
+
+        # Wait for the nodes to synchronize and start committing.
+        Print.info('Waiting for the nodes to synchronize...')
+        timeout = 2 * self.node_parameters.timeout_delay / 1000
+        self._wait_ready(nodes, timeout + self.READY_TIMEOUT)
+
+        # Wait for all transactions to be processed.
+        Print.info(f'Running benchmark ({self.duration} sec)...')
+        self._profile(commands, profile)
+        if live:
+            reader = LocalReader(
+                [join(self.path, x) for x in client_logs + node_logs]
+            )
+            try:
+                LogMonitor(
+                    reader, self.tx_size, self.node_parameters.timeout_delay
+                ).run(self.duration)
+            finally:
+                reader.close()
+        else:
+            sleep(self.duration)
+        if profile:
+            Print.info(f'Collecting the profiles of {len(profile)} node(s)...')
+            self._collect_profiles(profile, self.PROFILE_TIMEOUT)
+        self._kill_nodes()
+
+        # Parse logs and return the parser.
+        Print.info('Parsing logs...')
+        return LogParser.process(
+            join(self.path, PathMaker.logs_path()),
+            faults=self.faults,
+            regions=self.emulator.regions[:nodes] if self.emulator else [],
+            placement=placement.describe() if placement is not None else {},
+            hosts=[x.split(':')[0] for x in committee.front[:nodes]],
+            bench=self.bench_parameters.json
+        )
+
+    def _run_point(self, committee, rate, debug=False, profile=[], live=False):
+        # Run all the runs of a single (nodes, rate) point and return their
+        # parsers; failed runs are reported and skipped.
+        n = committee.size()
+        Print.heading(f'Running {n} nodes (input rate: {rate:,} tx/s)')
+        parsers = []
+        for i in range(self.runs):
+            Print.heading(f'Run {i+1}/{self.runs}')
+            try:
+                parser = self._run_single(committee, rate, debug, profile, live)
+                parser.print(PathMaker.result_file(
+                    n, rate, self.tx_size, self.faults, self.testbed
+                ))
+                parsers += [parser]
+            except (subprocess.SubprocessError, ParseError, TimeoutError, MonitorError) as e:
+                self._kill_nodes()
+                Print.error(BenchError('Benchmark failed', e))
+        return parsers
+
+    def _search(self, committee, debug=False, profile=[], live=False):
+        # Run the saturation search, recording every probe in the results.
+        parsers = []
+
+        def probe(rate):
+            runs = self._run_point(committee, rate, debug, profile, live)
+            parsers.extend(runs)
+            return [x.metrics() for x in runs]
+
+        SaturationSearch(
+            self.rate[0], self.max_latency, self.tolerance
+        ).run(probe)
+        return parsers
+
+    def run(self, debug=False, profile=[], live=False):
+        # Run every combination of committee size and input rate (or the
+        # saturation search of every committee size), `runs` times each. All
+        # runs are recorded in the results and their parsers returned.
+        # The nodes listed in `profile` (by index) are profiled with `perf`
+        # during the benchmark; their flame graphs are written to plots/.
+        # The `live` mode follows the logs during the run and aborts it early
+        # if it is broken.
         assert isinstance(debug, bool)
-        Print.heading('Starting local benchmark')
+        assert isinstance(profile, list)
+        assert isinstance(live, bool)
+        testbed = f' (testbed {self.testbed})' if self.testbed is not None else ''
+        Print.heading(f'Starting local benchmark{testbed}')
+
+        nodes = min(self.nodes) - self.faults
+        if any(not isinstance(x, int) or not 0 <= x < nodes for x in profile):
+            raise BenchError(
+                'Invalid profile option',
+                ConfigError(f'Profiled nodes must be in [0, {nodes})')
+            )
 
         # Kill any previous testbed.
         self._kill_nodes()
 
         try:
             Print.info('Setting up testbed...')
-            nodes, rate = self.nodes[0], self.rate[0]
-
-            # Cleanup all files.
-            cmd = f'{CommandMaker.clean_logs()} ; {CommandMaker.cleanup()}'
-            subprocess.run([cmd], shell=True, stderr=subprocess.DEVNULL)
-            sleep(0.5) # Removing the store may take time.
-
-            # Recompile the latest code.
-            cmd = CommandMaker.compile().split()
-            subprocess.run(cmd, check=True, cwd=PathMaker.node_crate_path())
-
-            # Create alias for the client and nodes binary.
-            cmd = CommandMaker.alias_binaries(PathMaker.binary_path())
-            subprocess.run([cmd], shell=True)
-
-            # Generate configuration files.
-            keys = []
-            key_files = [PathMaker.key_file(i) for i in range(nodes)]
-            for filename in key_files:
-                cmd = CommandMaker.generate_key(filename).split()
-                subprocess.run(cmd, check=True)
-                keys += [Key.from_file(filename)]
-
-            names = [x.name for x in keys]
-            committee = LocalCommittee(names, self.BASE_PORT)
-            committee.print(PathMaker.committee_file())
-
-            self.node_parameters.print(PathMaker.parameters_file())
-
-            # Do not boot faulty nodes.
-            nodes = nodes - self.faults
-
-            # Run the clients (they will wait for the nodes to be ready).
-            addresses = committee.front
-            rate_share = ceil(rate / nodes)
-            timeout = self.node_parameters.timeout_delay
-            client_logs = [PathMaker.client_log_file(i) for i in range(nodes)]
-            for addr, log_file in zip(addresses, client_logs):
-                cmd = CommandMaker.run_client(
-                    addr,
-                    self.tx_size,
-                    rate_share,
-                    timeout
-                )
-                self._background_run(cmd, log_file)
+            self._compile()
+            makedirs(PathMaker.results_path(), exist_ok=True)
 
-            # Run the nodes.
-            dbs = [PathMaker.db_path(i) for i in range(nodes)]
-            node_logs = [PathMaker.node_log_file(i) for i in range(nodes)]
-            for key_file, db, log_file in zip(key_files, dbs, node_logs):
-                cmd = CommandMaker.run_node(
-                    key_file,
-                    PathMaker.committee_file(),
-                    db,
-                    PathMaker.parameters_file(),
-                    debug=debug
-                )
-                self._background_run(cmd, log_file)
+            parsers = []
+            for n in self.nodes:
+                # The keys are generated once per committee size.
+                committee = self._config(n)
+                if self.max_latency is not None:
+                    Print.heading(f'Searching saturation point of {n} nodes')
+                    parsers += self._search(committee, debug, profile, live)
+                    continue
+                for r in self.rate:
+                    parsers += self._run_point(
+                        committee, r, debug, profile, live
+                    )
+            return parsers
 
-            # Wait for the nodes to synchronize
-            Print.info('Waiting for the nodes to synchronize...')
-            sleep(2 * self.node_parameters.timeout_delay / 1000)
-
-            # Wait for all transactions to be processed.
-            Print.info(f'Running benchmark ({self.duration} sec)...')
-            sleep(self.duration)
+        except ConfigError as e:
             self._kill_nodes()
+            raise BenchError('Invalid placement or WAN parameters', e)
 
-            # Parse logs and return the parser.
-            Print.info('Parsing logs...')
-            return LogParser.process('./logs', faults=self.faults)
-
-        except (subprocess.SubprocessError, ParseError) as e:
+        except (subprocess.SubprocessError, ParseError, TimeoutError, MonitorError) as e:
             self._kill_nodes()
             raise BenchError('Failed to run benchmark', e)
+
+    @staticmethod
+    def run_parallel(benches, debug=False, profile=[], live=False):
+        ''' Run several testbeds side by side and return the parsers of each
+        of them (or the BenchError that made it fail). '''
+        assert all(isinstance(x, LocalBench) for x in benches)
+        testbeds = [x.testbed for x in benches]
+        assert None not in testbeds and len(set(testbeds)) == len(testbeds)
+
+        def run(bench):
+            try:
+                return bench.run(debug, profile, live)
+            except BenchError as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=len(benches)) as executor:
+            return list(executor.map(run, benches))
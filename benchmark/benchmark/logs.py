@@ -1,31 +1,106 @@
-from datetime import datetime
+from array import array
+from bisect import bisect_right
+from base64 import b64decode
+import binascii
+import gzip
 from glob import glob
+from math import ceil, isnan, nan
 from multiprocessing import Pool
-from os.path import join
-from re import findall, search
-from statistics import mean
+from os import makedirs
+from os.path import basename, join, splitext
+from re import compile, split
+from statistics import mean, median
+from time import time
 
-from benchmark.utils import Print
+from benchmark.cache import CacheError, ParseCache
+from benchmark.database import DatabaseError, ResultsDB
+from benchmark.flamegraph import FlameGraph
+from benchmark.timestamps import TimestampDecoder
+from benchmark.utils import PathMaker, Print
 
 
 class ParseError(Exception):
     pass
 
 
+# NOTE: These patterns match the log entries that the nodes and clients emit
+# when compiled with the `benchmark` feature.
+TIMESTAMP = compile(r'\[(.*Z) ')
+TX_SIZE = compile(r'Transactions size: (\d+)')
+TX_RATE = compile(r'Transactions rate: (\d+)')
+SAMPLE_SENT = compile(r'\[(.*Z) .* sample transaction (\d+)')
+BLOCK = compile(r'\[(.*Z) .* (Created|Committed) B(\d+)\(([^ ]+)\)')
+TIMEOUT = compile(r'\[(.*Z) .* Timeout reached for round (\d+)')
+PAYLOAD_SIZE = compile(r'Payload ([^ ]+) contains (\d+) B')
+PAYLOAD_SAMPLE = compile(r'Payload ([^ ]+) contains sample tx (\d+)')
+# Every worker process decodes the timestamps with its own cache.
+TIMESTAMPS = TimestampDecoder()
+DIGEST_SIZE = 32  # B
+STEADY_STATE_WINDOW = 1  # s
+STEADY_STATE_FRACTION = 0.5
+# A view change is over once a window reaches this share of the steady state.
+RECOVERY_FRACTION = 0.9
+# Commit gaps longer than this share of the timeout delay count as stalls.
+STALL_FRACTION = 0.5
+RESOURCES_NAME = compile(r'resources-(.*)\.log')
+PROFILE_NAME = compile(r'profile-(.*)\.log')
+NODE_NAME = compile(r'(node-\d+)\.log')
+PERCENTILES = {'p50': 50, 'p90': 90, 'p99': 99, 'p99.9': 99.9, 'max': 100}
+# The stages of a sample transaction's latency: from the client to the sealing
+# of its payload by the mempool, then to the proposal of a block referencing
+# the payload, and finally to the commit of that block.
+STAGES = {
+    'batching': 'Client to payload sealed',
+    'proposal': 'Payload sealed to proposed',
+    'consensus': 'Proposed to committed',
+}
+NODE_CONFIGS = {
+    'consensus.timeout_delay': compile(r'Consensus timeout delay .* (\d+)'),
+    'consensus.sync_retry_delay': compile(
+        r'Consensus synchronizer retry delay .* (\d+)'
+    ),
+    'consensus.max_payload_size': compile(
+        r'Consensus max payload size .* (\d+)'
+    ),
+    'consensus.min_block_delay': compile(r'Consensus min block delay .* (\d+)'),
+    'mempool.queue_capacity': compile(r'Mempool queue capacity set to (\d+)'),
+    'mempool.sync_retry_delay': compile(
+        r'Mempool synchronizer retry delay .* (\d+)'
+    ),
+    'mempool.max_payload_size': compile(r'Mempool max payload size .* (\d+)'),
+    'mempool.min_block_delay': compile(r'Mempool min block delay .* (\d+)'),
+}
+
+
 class LogParser:
-    def __init__(self, clients, nodes, faults=0):
+    # Bump when the parsing changes, to invalidate the cached results.
+    CACHE_VERSION = 1
+
+    def __init__(self, clients, nodes, faults=0, resources=[], profiles=[], regions=[], placement={}, hosts=[], bench={}, cache=None):
         inputs = [clients, nodes]
         assert all(isinstance(x, list) for x in inputs)
         assert all(isinstance(x, str) for y in inputs for x in y)
         assert all(x for x in inputs)
+        assert isinstance(resources, list)
+        assert isinstance(profiles, list)
+        assert isinstance(regions, list)
+        assert not regions or len(regions) == len(nodes)
+        assert isinstance(hosts, list)
+        assert isinstance(bench, dict)
+        assert cache is None or isinstance(cache, ParseCache)
 
         self.faults = faults
         self.committee_size = len(nodes) + faults
-
-        # Parse the clients logs.
+        self.node_names = [NODE_NAME.search(basename(x)).group(1) for x in nodes]
+        self.regions = regions  # The region of each node (if known).
+        self.placement = placement  # The CPUs and memory of each process.
+        self.hosts = hosts  # The host of each node (if known).
+        self.bench = bench  # The bench parameters (if known).
+
+        # Parse the clients logs. Workers receive file names (not contents)
+        # and stream through the files, so memory stays flat.
         try:
-            with Pool() as p:
-                results = p.map(self._parse_clients, clients)
+            results = self._parse(self._parse_clients, 'clients', clients, cache)
         except (ValueError, IndexError) as e:
             raise ParseError(f'Failed to parse client logs: {e}')
         self.size, self.rate, self.start, misses, self.sent_samples \
@@ -34,18 +109,70 @@ class LogParser:
 
         # Parse the nodes logs.
         try:
-            with Pool() as p:
-                results = p.map(self._parse_nodes, nodes)
+            results = self._parse(self._parse_nodes, 'nodes', nodes, cache)
         except (ValueError, IndexError) as e:
             raise ParseError(f'Failed to parse node logs: {e}')
-        proposals, commits, sizes, self.received_samples, timeouts, self.configs \
-            = zip(*results)
-        self.proposals = self._merge_results([x.items() for x in proposals])
-        self.commits = self._merge_results([x.items() for x in commits])
-        self.sizes = {
-            k: v for x in sizes for k, v in x.items() if k in self.commits
+        digests, proposals, commits, sealed, sizes, sample_txs, sample_ids, \
+            self.rounds, timeouts, self.configs = zip(*results)
+        self.timeout_times = [[t for t, _ in x] for x in timeouts]
+        self.timeout_rounds = self._merge_results(
+            [((r, t) for t, r in x) for x in timeouts]
+        )
+
+        # The digests are interned to the same integer ids across nodes, and
+        # the commits of every node are kept in an array indexed by id.
+        ids, self.digest_count = self._intern(digests)
+        self.node_commits = [
+            self._scatter(x, y, self.digest_count) for x, y in zip(ids, commits)
+        ]
+        self.node_proposals = [
+            dict(self._items(x, y)) for x, y in zip(ids, proposals)
+        ]
+        self.received_samples = [
+            dict(zip(x, (y[z] for z in w)))
+            for x, y, w in zip(sample_txs, ids, sample_ids)
+        ]
+        self.sealed = self._merge_results(
+            [self._items(x, y) for x, y in zip(ids, sealed)]
+        )
+        self.proposals = self._merge_results(
+            [x.items() for x in self.node_proposals]
+        )
+        self.commits = self._merge_results(
+            [self._items(range(self.digest_count), x) for x in self.node_commits]
+        )
+        self.sizes = self._committed_sizes(
+            [self._items(x, y) for x, y in zip(ids, sizes)]
+        )
+        self.timeouts = max(len(x) for x in self.timeout_times)
+
+        # Parse the resources sampled next to each node and client.
+        try:
+            results = self._parse(self._parse_resources, 'resources', resources, cache)
+        except (ValueError, IndexError) as e:
+            raise ParseError(f'Failed to parse resources logs: {e}')
+        self.resources = {
+            RESOURCES_NAME.search(basename(x)).group(1): y
+            for x, y in zip(resources, results)
         }
-        self.timeouts = max(timeouts)
+
+        # Fold the call stacks sampled on the profiled nodes (if any). The
+        # flame graphs are rendered when the results are printed.
+        try:
+            results = self._parse(self._parse_profile, 'profile', profiles, cache)
+        except (ValueError, IndexError) as e:
+            raise ParseError(f'Failed to parse profiles: {e}')
+        self.profiles = {
+            PROFILE_NAME.search(basename(x)).group(1): y
+            for x, y in zip(profiles, results)
+        }
+        self.profile_files = {}
+
+        if cache is not None:
+            try:
+                cache.save()
+            except CacheError as e:
+                Print.warn(str(e))
 
         # Check whether clients missed their target rate.
         if self.misses != 0:
@@ -58,6 +185,60 @@ class LogParser:
         if self.timeouts > 2:
             Print.warn(f'Nodes timed out {self.timeouts:,} time(s)')
 
+    def _parse(self, parse, kind, filenames, cache):
+        # Parse the files in parallel, reusing the results cached by earlier
+        # analyses of the same files. The parsing functions are static, so
+        # the tasks only carry file names, not the state of the parser.
+        if cache is None:
+            with Pool() as p:
+                return p.map(parse, filenames)
+
+        keys = [
+            cache.key(f'{kind}-v{self.CACHE_VERSION}', x) for x in filenames
+        ]
+        results = [cache.get(x) for x in keys]
+        missing = [i for i, x in enumerate(results) if x is None]
+        if missing:
+            with Pool() as p:
+                parsed = p.map(parse, [filenames[i] for i in missing])
+            for i, x in zip(missing, parsed):
+                results[i] = x
+                try:
+                    cache.put(keys[i], x)
+                except CacheError as e:
+                    Print.warn(str(e))
+        return results
+
+    def _committed_sizes(self, sizes):
+        # The size of every committed payload.
+        return {k: v for x in sizes for k, v in x if k in self.commits}
+
+    @staticmethod
+    def _intern(digests):
+        # Map the local digest ids of every node (the digests being listed in
+        # order of local id) to global ones.
+        ids, mappings = {}, []
+        for x in digests:
+            mappings += [array('q', (
+                ids.setdefault(x[i:i + DIGEST_SIZE], len(ids))
+                for i in range(0, len(x), DIGEST_SIZE)
+            ))]
+        return mappings, len(ids)
+
+    @staticmethod
+    def _items(ids, values):
+        # The (global id, value) pairs of a per-node array indexed by local
+        # id, skipping the missing values (NaN times and negative sizes).
+        return ((i, x) for i, x in zip(ids, values) if x >= 0)
+
+    @staticmethod
+    def _scatter(ids, values, size):
+        # Re-index a per-node array by global id.
+        scattered = array('d', [nan]) * size
+        for i, x in zip(ids, values):
+            scattered[i] = x
+        return scattered
+
     def _merge_results(self, input):
         # Keep the earliest timestamp.
         merged = {}
@@ -67,84 +248,283 @@ class LogParser:
                     merged[k] = v
         return merged
 
-    def _parse_clients(self, log):
-        if search(r'Error', log) is not None:
-            raise ParseError('Client(s) panicked')
-
-        size = int(search(r'Transactions size: (\d+)', log).group(1))
-        rate = int(search(r'Transactions rate: (\d+)', log).group(1))
-
-        tmp = search(r'\[(.*Z) .* Start ', log).group(1)
-        start = self._to_posix(tmp)
-
-        misses = len(findall(r'rate too high', log))
-
-        tmp = findall(r'\[(.*Z) .* sample transaction (\d+)', log)
-        samples = {int(s): self._to_posix(t) for t, s in tmp}
+    @staticmethod
+    def _open(filename):
+        # Logs may be downloaded compressed; read them without unpacking.
+        if filename.endswith('.gz'):
+            return gzip.open(filename, 'rt')
+        return open(filename, 'r')
+
+    @staticmethod
+    def match_client_line(line):
+        ''' Dispatch a client log line to the (at most one) rule it matches,
+        using cheap substring checks before running any regex. Returns the
+        rule ('sample', 'miss', 'error', 'start', 'size', or 'rate') and the
+        values it captures, or (None, None). The LogMonitor shares these
+        rules. '''
+        if 'sample transaction' in line:
+            rule, match = 'sample', SAMPLE_SENT.search(line)
+        elif 'rate too high' in line:
+            return 'miss', ()
+        elif 'Error' in line:
+            return 'error', ()
+        elif ' Start ' in line:
+            rule, match = 'start', TIMESTAMP.search(line)
+        elif 'Transactions size' in line:
+            rule, match = 'size', TX_SIZE.search(line)
+        elif 'Transactions rate' in line:
+            rule, match = 'rate', TX_RATE.search(line)
+        else:
+            return None, None
+        return (rule, match.groups()) if match is not None else (None, None)
+
+    @staticmethod
+    def match_node_line(line):
+        ''' Dispatch a node log line like `match_client_line`. The rules are
+        'sample' (digest, tx id), 'size' (digest, bytes), 'block' (time,
+        Created or Committed, round, digest), 'timeout' (time, round),
+        'panic', and 'config' (key, value). '''
+        if 'Payload ' in line:
+            match = PAYLOAD_SAMPLE.search(line)
+            if match is not None:
+                return 'sample', match.groups()
+            rule, match = 'size', PAYLOAD_SIZE.search(line)
+        elif 'Created B' in line or 'Committed B' in line:
+            rule, match = 'block', BLOCK.search(line)
+        elif ' WARN ' in line and 'Timeout' in line:
+            rule, match = 'timeout', TIMEOUT.search(line)
+        elif 'panic' in line:
+            return 'panic', ()
+        elif ' set to ' in line:
+            for key, regex in NODE_CONFIGS.items():
+                match = regex.search(line)
+                if match is not None:
+                    return 'config', (key, match.group(1))
+            return None, None
+        else:
+            return None, None
+        return (rule, match.groups()) if match is not None else (None, None)
+
+    @staticmethod
+    def _parse_clients(filename):
+        size = rate = start = None
+        misses = 0
+        samples = {}
+
+        # Single pass over the file.
+        with LogParser._open(filename) as f:
+            for line in f:
+                rule, values = LogParser.match_client_line(line)
+                if rule == 'sample':
+                    t, s = values
+                    samples[int(s)] = LogParser._to_posix(t)
+                elif rule == 'miss':
+                    misses += 1
+                elif rule == 'error':
+                    raise ParseError('Client(s) panicked')
+                elif rule == 'start' and start is None:
+                    start = LogParser._to_posix(values[0])
+                elif rule == 'size' and size is None:
+                    size = int(values[0])
+                elif rule == 'rate' and rate is None:
+                    rate = int(values[0])
+
+        if None in (size, rate, start):
+            raise ParseError(f'Incomplete client log {filename}')
 
         return size, rate, start, misses, samples
 
-    def _parse_nodes(self, log):
-        if search(r'panic', log) is not None:
-            raise ParseError('Client(s) panicked')
-
-        tmp = findall(r'\[(.*Z) .* Created B\d+\(([^ ]+)\)', log)
-        tmp = [(d, self._to_posix(t)) for t, d in tmp]
-        proposals = self._merge_results([tmp])
-
-        tmp = findall(r'\[(.*Z) .* Committed B\d+\(([^ ]+)\)', log)
-        tmp = [(d, self._to_posix(t)) for t, d in tmp]
-        commits = self._merge_results([tmp])
-
-        tmp = findall(r'Payload ([^ ]+) contains (\d+) B', log)
-        sizes = {d: int(s) for d, s in tmp}
-
-        tmp = findall(r'Payload ([^ ]+) contains sample tx (\d+)', log)
-        samples = {int(s): d for d, s in tmp}
-
-        tmp = findall(r'.* WARN .* Timeout', log)
-        timeouts = len(tmp)
+    @staticmethod
+    def _parse_nodes(filename):
+        # The payloads are indexed by the local id of their digest; their
+        # times are NaN and their size -1 until known.
+        ids = {}
+        proposals, commits, sealed = array('d'), array('d'), array('d')
+        sizes = array('q')
+        sample_txs, sample_ids = array('q'), array('q')
+        rounds = set()  # The rounds of the (non-empty) blocks we proposed.
+        timeouts = []
+        configs = {}
+
+        def intern(digest):
+            i = ids.get(digest)
+            if i is None:
+                i = ids[digest] = len(ids)
+                proposals.append(nan)
+                commits.append(nan)
+                sealed.append(nan)
+                sizes.append(-1)
+            return i
+
+        with LogParser._open(filename) as f:
+            for line in f:
+                rule, values = LogParser.match_node_line(line)
+                if rule == 'sample':
+                    d, s = values
+                    i = intern(d)
+                    sample_txs.append(int(s))
+                    sample_ids.append(i)
+                    if isnan(sealed[i]):
+                        t = TIMESTAMP.search(line).group(1)
+                        sealed[i] = LogParser._to_posix(t)
+                elif rule == 'size':
+                    d, s = values
+                    sizes[intern(d)] = int(s)
+                elif rule == 'block':
+                    t, kind, r, d = values
+                    if kind == 'Created':
+                        target = proposals
+                        rounds.add(int(r))
+                    else:
+                        target = commits
+                    t = LogParser._to_posix(t)
+                    i = intern(d)
+                    if isnan(target[i]) or target[i] > t:
+                        target[i] = t
+                elif rule == 'timeout':
+                    t, r = values
+                    timeouts.append((LogParser._to_posix(t), int(r)))
+                elif rule == 'panic':
+                    raise ParseError('Node(s) panicked')
+                elif rule == 'config':
+                    key, value = values
+                    configs[key] = int(value)
+
+        missing = [k for k in NODE_CONFIGS if k not in configs]
+        if missing:
+            raise ParseError(f'Missing {missing[0]} in node log {filename}')
 
         configs = {
             'consensus': {
-                'timeout_delay': int(
-                    search(r'Consensus timeout delay .* (\d+)', log).group(1)
-                ),
-                'sync_retry_delay': int(
-                    search(
-                        r'Consensus synchronizer retry delay .* (\d+)', log
-                    ).group(1)
-                ),
-                'max_payload_size': int(
-                    search(r'Consensus max payload size .* (\d+)', log).group(1)
-                ),
-                'min_block_delay': int(
-                    search(r'Consensus min block delay .* (\d+)', log).group(1)
-                ),
+                'timeout_delay': configs['consensus.timeout_delay'],
+                'sync_retry_delay': configs['consensus.sync_retry_delay'],
+                'max_payload_size': configs['consensus.max_payload_size'],
+                'min_block_delay': configs['consensus.min_block_delay'],
             },
             'mempool': {
-                'queue_capacity': int(
-                    search(r'Mempool queue capacity set to (\d+)', log).group(1)
-                ),
-                'sync_retry_delay': int(
-                    search(
-                        r'Mempool synchronizer retry delay .* (\d+)', log
-                    ).group(1)
-                ),
-                'max_payload_size': int(
-                    search(r'Mempool max payload size .* (\d+)', log).group(1)
-                ),
-                'min_block_delay': int(
-                    search(r'Mempool min block delay .* (\d+)', log).group(1)
-                ),
+                'queue_capacity': configs['mempool.queue_capacity'],
+                'sync_retry_delay': configs['mempool.sync_retry_delay'],
+                'max_payload_size': configs['mempool.max_payload_size'],
+                'min_block_delay': configs['mempool.min_block_delay'],
             }
         }
 
-        return proposals, commits, sizes, samples, timeouts, configs
+        # Ship the digests compactly, as their 32 bytes.
+        try:
+            digests = b''.join(b64decode(x) for x in ids)
+        except binascii.Error:
+            raise ParseError(f'Malformed digest in node log {filename}')
+        if len(digests) != DIGEST_SIZE * len(ids):
+            raise ParseError(f'Malformed digest in node log {filename}')
+
+        return (
+            digests, proposals, commits, sealed, sizes, sample_txs,
+            sample_ids, len(rounds), timeouts, configs
+        )
+
+    @staticmethod
+    def _parse_resources(filename):
+        # Each sample holds: timestamp, cpu time (s), rss (B), bytes read,
+        # bytes written, and bytes received and sent over the network by the
+        # whole host.
+        samples = []
+        with LogParser._open(filename) as f:
+            for line in f:
+                values = line.split()
+                if len(values) == 7 and values[0][0].isdigit():
+                    samples.append([float(x) for x in values])
+
+        if len(samples) < 2:
+            return {
+                'cpu': 0, 'cpu_peak': 0, 'rss': 0, 'rss_peak': 0,
+                'disk_write': 0, 'net_rx': 0, 'net_tx': 0
+            }
+
+        cpu = [
+            (y[1] - x[1]) / (y[0] - x[0]) * 100
+            for x, y in zip(samples, samples[1:]) if y[0] > x[0]
+        ]
+        first, last = samples[0], samples[-1]
+        duration = last[0] - first[0]
+        return {
+            'cpu': mean(cpu) if cpu else 0,  # Percent of one core.
+            'cpu_peak': max(cpu) if cpu else 0,
+            'rss': mean(x[2] for x in samples),
+            'rss_peak': max(x[2] for x in samples),
+            'disk_write': (last[4] - first[4]) / duration if duration else 0,
+            'net_rx': last[5] - first[5],
+            'net_tx': last[6] - first[6],
+        }
+
+    @staticmethod
+    def _parse_profile(filename):
+        with LogParser._open(filename) as f:
+            return FlameGraph.from_perf_script(f)
+
+    def _print_profiles(self, run):
+        # Render the flame graph of every profiled node of this run.
+        makedirs(PathMaker.plots_path(), exist_ok=True)
+        files = {}
+        for name, flamegraph in sorted(self.profiles.items()):
+            flamegraph.print_folded(PathMaker.flamegraph_file(run, name, 'folded'))
+            files[name] = PathMaker.flamegraph_file(run, name, 'svg')
+            flamegraph.print_svg(files[name], title=f'{run} ({name})')
+        return files
+
+    @staticmethod
+    def _format_profiles(profiles):
+        if not profiles:
+            return ''
+        lines = ''.join(f' {x}: {y}\n' for x, y in sorted(profiles.items()))
+        return f'\n + PROFILES:\n{lines}'
+
+    @staticmethod
+    def _format_placement(placement):
+        if not placement:
+            return ''
+        lines = ''.join(
+            f' {x}: CPUs {y["cpus"]}'
+            + (f', memory {y["memory"]:,} MB' if y['memory'] else '')
+            + '\n'
+            for x, y in placement.items() if x != 'mode'
+        )
+        return f'\n + PLACEMENT ({placement["mode"]}):\n{lines}'
+
+    @staticmethod
+    def _format_resources(resources, hosts=[]):
+        if not resources:
+            return ''
+        # List the nodes first, then the clients.
+        names = sorted(
+            resources,
+            key=lambda x: (not x.startswith('node'), int(x.split('-')[-1]))
+        )
+        lines = ''.join(
+            f' {x}: CPU {round(r["cpu"]):,}% (peak {round(r["cpu_peak"]):,}%), '
+            f'RSS {r["rss"] / 10**6:,.0f} MB (peak {r["rss_peak"] / 10**6:,.0f} MB), '
+            f'disk write {r["disk_write"] / 10**6:,.1f} MB/s\n'
+            for x, r in ((x, resources[x]) for x in names)
+        )
+
+        # The network counters are those of the whole host (network
+        # namespace) of the process, so the processes sharing a host (eg.
+        # all of them in local runs) report the same traffic: print it once
+        # per host.
+        network = {}
+        for x in names:
+            i = int(x.split('-')[-1])
+            host = hosts[i] if i < len(hosts) else f'host of {x}'
+            network.setdefault(host, resources[x])
+        lines += ''.join(
+            f' {x}: host network {r["net_rx"] / 10**6:,.0f} MB in / '
+            f'{r["net_tx"] / 10**6:,.0f} MB out\n'
+            for x, r in network.items()
+        )
+        return f'\n + RESOURCES:\n{lines}'
 
-    def _to_posix(self, string):
-        x = datetime.fromisoformat(string.replace('Z', '+00:00'))
-        return datetime.timestamp(x)
+    @staticmethod
+    def _to_posix(string):
+        return TIMESTAMPS(string)
 
     def _consensus_throughput(self):
         if not self.commits:
@@ -157,8 +537,9 @@ class LogParser:
         return tps, bps, duration
 
     def _consensus_latency(self):
-        latency = [c - self.proposals[d] for d, c in self.commits.items()]
-        return mean(latency) if latency else 0
+        return array(
+            'd', (c - self.proposals[d] for d, c in self.commits.items())
+        )
 
     def _end_to_end_throughput(self):
         if not self.commits:
@@ -170,31 +551,335 @@ class LogParser:
         tps = bps / self.size[0]
         return tps, bps, duration
 
-    def _end_to_end_latency(self):
-        latency = []
+    def _end_to_end_samples(self):
+        # Yield the commit time and end-to-end latency of every sample tx.
         for sent, received in zip(self.sent_samples, self.received_samples):
             for tx_id, batch_id in received.items():
                 if batch_id in self.commits:
                     assert tx_id in sent  # We receive txs that we sent.
                     start = sent[tx_id]
                     end = self.commits[batch_id]
-                    latency += [end-start]
-        return mean(latency) if latency else 0
+                    yield end, end-start
 
-    def result(self):
-        consensus_latency = self._consensus_latency() * 1000
+    def _end_to_end_latency(self):
+        return array('d', (x for _, x in self._end_to_end_samples()))
+
+    def stage_latency(self):
+        ''' Split the end-to-end latency of every committed sample tx into
+        the stages listed in STAGES (in seconds). '''
+        stages = {k: array('d') for k in STAGES}
+        for sent, received in zip(self.sent_samples, self.received_samples):
+            for tx_id, batch_id in received.items():
+                if batch_id not in self.commits or tx_id not in sent:
+                    continue
+                sealed = self.sealed.get(batch_id)
+                proposed = self.proposals.get(batch_id)
+                if sealed is None or proposed is None:
+                    continue
+                stages['batching'].append(sealed - sent[tx_id])
+                stages['proposal'].append(proposed - sealed)
+                stages['consensus'].append(self.commits[batch_id] - proposed)
+        return stages
+
+    def _node_latency(self, i):
+        # The commit lag of node i and the consensus latency of its proposals.
+        lag = array('d', (
+            t - self.commits[d] for d, t in enumerate(self.node_commits[i])
+            if not isnan(t)
+        ))
+        latency = array('d', (
+            self.commits[d] - t
+            for d, t in self.node_proposals[i].items() if d in self.commits
+        ))
+        return lag, latency
+
+    def node_breakdown(self):
+        ''' Per-node commit lag (relative to the earliest commit of each
+        payload) and share of the proposed blocks, with the consensus latency
+        of the payloads that each node proposed as leader. '''
+        total = sum(self.rounds)
+        breakdown = []
+        for i, name in enumerate(self.node_names):
+            lag, latency = self._node_latency(i)
+            breakdown += [{
+                'node': name,
+                'region': self.regions[i] if self.regions else None,
+                'commits': len(lag),
+                'lag': self._percentiles(lag),
+                'proposals': self.rounds[i],
+                'leader_share': self.rounds[i] / total if total else 0,
+                'leader_latency': self._percentiles(latency),
+            }]
+        return breakdown
+
+    @staticmethod
+    def _format_nodes(breakdown):
+        lines = ''.join(
+            f' {x["node"]}'
+            + (f' ({x["region"]})' if x['region'] else '')
+            + f': commit lag p50 {round(x["lag"]["p50"]):,} ms, '
+            f'p99 {round(x["lag"]["p99"]):,} ms, '
+            f'max {round(x["lag"]["max"]):,} ms; '
+            f'leader of {x["proposals"]:,} blocks '
+            f'({100 * x["leader_share"]:.0f}%), '
+            f'consensus latency p50 {round(x["leader_latency"]["p50"]):,} ms, '
+            f'p99 {round(x["leader_latency"]["p99"]):,} ms\n'
+            for x in breakdown
+        )
+        return f'\n + NODES:\n{lines}'
+
+    def view_changes(self, timeline, steady_tps):
+        ''' Analyse the timeouts of the benchmark: the commit stalls, the
+        number of view changes (rounds that timed out after the clients
+        started), the time to recover the steady-state throughput after each
+        of them, and the transactions that were not committed meanwhile. '''
+        origin = min(self.start)
+        window = timeline[1]['start'] - timeline[0]['start'] \
+            if len(timeline) > 1 else STEADY_STATE_WINDOW
+
+        # The gaps between consecutive commits that exceed the threshold.
+        timeout_delay = self.configs[0]['consensus']['timeout_delay'] / 1000
+        threshold = STALL_FRACTION * timeout_delay
+        commits = sorted(set(self.commits.values()))
+        gaps = [y - x for x, y in zip(commits, commits[1:])]
+        stalls = [x for x in gaps if x > threshold]
+
+        # The nodes log a timeout when the stall ends: each stall starts at
+        # the last commit before it (or a timeout delay earlier), and its
+        # cost is counted from the first window after that commit.
+        events = []
+        for r, t in sorted(self.timeout_rounds.items()):
+            if t < origin:
+                continue  # Nodes time out once while booting.
+            i = bisect_right(commits, t - threshold)
+            start = max(commits[i - 1] if i else t - timeout_delay, origin)
+            first = int((start - origin) // window) + 1
+            recovered, lost = None, 0
+            for x in timeline[first:]:
+                if x['tps'] >= RECOVERY_FRACTION * steady_tps:
+                    recovered = max(0, x['start'] - (start - origin))
+                    break
+                lost += (steady_tps - x['tps']) * window
+            events += [{
+                'round': r,
+                'time': start - origin,
+                'recovery': recovered,
+                'lost_tx': lost,
+            }]
+
+        recoveries = [x['recovery'] for x in events if x['recovery'] is not None]
+        return {
+            'view_changes': len(events),
+            'stalls': len(stalls),
+            'stall_time': sum(stalls),
+            'max_stall': max(stalls) if stalls else 0,
+            'recovery_time': mean(recoveries) if recoveries else 0,
+            'max_recovery_time': max(recoveries) if recoveries else 0,
+            'unrecovered': len(events) - len(recoveries),
+            'lost_tx': sum(x['lost_tx'] for x in events),
+            'events': events,
+        }
+
+    @staticmethod
+    def _format_view_changes(report):
+        if not report['view_changes'] and not report['stalls']:
+            return ''
+        unrecovered = (
+            f' ({report["unrecovered"]:,} never recovered)'
+            if report['unrecovered'] else ''
+        )
+        return (
+            '\n + VIEW CHANGES:\n'
+            f' View changes: {report["view_changes"]:,}{unrecovered}\n'
+            f' Time without progress: {report["stall_time"]:,.1f} s '
+            f'({report["stalls"]:,} stalls, longest '
+            f'{report["max_stall"]:,.1f} s)\n'
+            f' Recovery time: {report["recovery_time"]:,.1f} s '
+            f'(max {report["max_recovery_time"]:,.1f} s)\n'
+            f' Throughput lost: {round(report["lost_tx"]):,} tx\n'
+        )
+
+    @staticmethod
+    def _format_stages(latency, percentiles):
+        lines = ''.join(
+            f' {name}: {round(latency[k]):,} ms ('
+            + ', '.join(
+                f'{p} {round(v):,} ms' for p, v in percentiles[k].items()
+            )
+            + ')\n'
+            for k, name in STAGES.items()
+        )
+        return f'\n + LATENCY BREAKDOWN:\n{lines}'
+
+    def timeline(self, window=1):
+        ''' Bucket commits, bytes, sample latencies, and timeouts into fixed
+        windows (in seconds) starting when the clients start sending. '''
+        assert window > 0
+        if not self.commits:
+            return []
+
+        origin = min(self.start)
+        end = max(self.commits.values())
+        count = max(0, int((end - origin) // window)) + 1
+
+        def bucket(t):
+            return min(count - 1, max(0, int((t - origin) // window)))
+
+        commits, bytes, timeouts = [0] * count, [0] * count, [0] * count
+        latency = [array('d') for _ in range(count)]
+        for digest, t in self.commits.items():
+            i = bucket(t)
+            commits[i] += 1
+            bytes[i] += self.sizes.get(digest, 0)
+        for t, x in self._end_to_end_samples():
+            latency[bucket(t)].append(x)
+        for t in (x for y in self.timeout_times for x in y):
+            timeouts[bucket(t)] += 1
+
+        return [{
+            'start': i * window,
+            'commits': commits[i],
+            'bytes': bytes[i],
+            'tps': bytes[i] / self.size[0] / window,
+            'latency': self._mean(latency[i]),
+            'latency_p99': self._percentiles(latency[i])['p99'],
+            'timeouts': timeouts[i]
+        } for i in range(count)]
+
+    def _steady_state(self, timeline):
+        # Trim the warm-up and cool-down windows, that is the leading and
+        # trailing windows whose throughput is well below the median.
+        if not timeline:
+            return 0, 0, 0
+        threshold = STEADY_STATE_FRACTION * median(x['tps'] for x in timeline)
+        steady = [i for i, x in enumerate(timeline) if x['tps'] >= threshold]
+        timeline = timeline[steady[0]:steady[-1] + 1]
+        tps = mean(x['tps'] for x in timeline)
+        return tps, timeline[0]['start'], len(timeline)
+
+    def _percentiles(self, latency):
+        # Nearest-rank percentiles (in ms) of the latency distribution.
+        if not len(latency):
+            return {k: 0 for k in PERCENTILES}
+        latency = sorted(latency)
+        ranks = {
+            k: ceil(len(latency) * p / 100) - 1 for k, p in PERCENTILES.items()
+        }
+        return {k: latency[max(0, r)] * 1000 for k, r in ranks.items()}
+
+    def _mean(self, latency):
+        # Mean latency (in ms).
+        return mean(latency) * 1000 if len(latency) else 0
+
+    def latency_percentiles(self):
+        return {
+            'consensus': self._percentiles(self._consensus_latency()),
+            'end_to_end': self._percentiles(self._end_to_end_latency())
+        }
+
+    @staticmethod
+    def _format_percentiles(name, percentiles):
+        return ''.join(
+            f' {name} latency {k}: {round(v):,} ms\n'
+            for k, v in percentiles.items()
+        )
+
+    def metrics(self):
+        consensus_latency = self._consensus_latency()
         consensus_tps, consensus_bps, _ = self._consensus_throughput()
         end_to_end_tps, end_to_end_bps, duration = self._end_to_end_throughput()
-        end_to_end_latency = self._end_to_end_latency() * 1000
+        end_to_end_latency = self._end_to_end_latency()
+        stages = self.stage_latency()
+        window = STEADY_STATE_WINDOW
+        timeline = self.timeline(window)
+        steady_tps, steady_start, steady_windows = self._steady_state(timeline)
+        view_changes = self.view_changes(timeline, steady_tps)
+
+        return {
+            'duration': duration,
+            'input_rate': sum(self.rate),
+            'consensus_tps': consensus_tps,
+            'consensus_bps': consensus_bps,
+            'consensus_latency': self._mean(consensus_latency),
+            'consensus_percentiles': self._percentiles(consensus_latency),
+            'end_to_end_tps': end_to_end_tps,
+            'end_to_end_bps': end_to_end_bps,
+            'end_to_end_latency': self._mean(end_to_end_latency),
+            'end_to_end_percentiles': self._percentiles(end_to_end_latency),
+            'steady_state_tps': steady_tps,
+            'steady_state_start': steady_start,
+            'steady_state_end': steady_start + steady_windows * window,
+            'stage_latency': {k: self._mean(x) for k, x in stages.items()},
+            'stage_percentiles': {
+                k: self._percentiles(x) for k, x in stages.items()
+            },
+            'view_changes': view_changes['view_changes'],
+            'stall_time': view_changes['stall_time'],
+            'recovery_time': view_changes['recovery_time'],
+            'lost_tx': view_changes['lost_tx'],
+            'view_change_report': view_changes,
+            'node_breakdown': self.node_breakdown(),
+            'resources': self.resources,
+            'placement': self.placement,
+            'profiles': self.profile_files,
+        }
 
-        consensus_timeout_delay = self.configs[0]['consensus']['timeout_delay']
-        consensus_sync_retry_delay = self.configs[0]['consensus']['sync_retry_delay']
-        consensus_max_payload_size = self.configs[0]['consensus']['max_payload_size']
-        consensus_min_block_delay = self.configs[0]['consensus']['min_block_delay']
-        mempool_queue_capacity = self.configs[0]['mempool']['queue_capacity']
-        mempool_sync_retry_delay = self.configs[0]['mempool']['sync_retry_delay']
-        mempool_max_payload_size = self.configs[0]['mempool']['max_payload_size']
-        mempool_min_block_delay = self.configs[0]['mempool']['min_block_delay']
+    def record(self):
+        ''' The structured record of the run: its setup, the node and bench
+        parameters, the hosts, the timestamps, and all the metrics. The text
+        summary is rendered from it. '''
+        return {
+            'timestamp': time(),
+            'commit_hash': ResultsDB.current_commit(),
+            'setup': {
+                'nodes': self.committee_size,
+                'rate': sum(self.rate),
+                'tx_size': self.size[0],
+                'faults': self.faults,
+            },
+            'parameters': self.configs[0],
+            'bench': self.bench,
+            'hosts': self.hosts,
+            'regions': self.regions,
+            'start': min(self.start),
+            'end': max(self.commits.values()) if self.commits else None,
+            'metrics': self.metrics(),
+        }
+
+    @classmethod
+    def render(cls, record):
+        ''' Render the text summary of a run from its record. '''
+        setup, metrics = record['setup'], record['metrics']
+        duration = metrics['duration']
+        consensus_tps = metrics['consensus_tps']
+        consensus_bps = metrics['consensus_bps']
+        consensus_latency = metrics['consensus_latency']
+        end_to_end_tps = metrics['end_to_end_tps']
+        end_to_end_bps = metrics['end_to_end_bps']
+        end_to_end_latency = metrics['end_to_end_latency']
+        steady_tps = metrics['steady_state_tps']
+        steady_start = metrics['steady_state_start']
+        steady_end = metrics['steady_state_end']
+
+        consensus_percentiles = cls._format_percentiles(
+            'Consensus', metrics['consensus_percentiles']
+        )
+        end_to_end_percentiles = cls._format_percentiles(
+            'End-to-end', metrics['end_to_end_percentiles']
+        )
+        stages = cls._format_stages(
+            metrics['stage_latency'], metrics['stage_percentiles']
+        )
+
+        parameters = record['parameters']
+        consensus_timeout_delay = parameters['consensus']['timeout_delay']
+        consensus_sync_retry_delay = parameters['consensus']['sync_retry_delay']
+        consensus_max_payload_size = parameters['consensus']['max_payload_size']
+        consensus_min_block_delay = parameters['consensus']['min_block_delay']
+        mempool_queue_capacity = parameters['mempool']['queue_capacity']
+        mempool_sync_retry_delay = parameters['mempool']['sync_retry_delay']
+        mempool_max_payload_size = parameters['mempool']['max_payload_size']
+        mempool_min_block_delay = parameters['mempool']['min_block_delay']
 
         return (
             '\n'
@@ -202,10 +887,10 @@ class LogParser:
             ' SUMMARY:\n'
             '-----------------------------------------\n'
             ' + CONFIG:\n'
-            f' Committee size: {self.committee_size} nodes\n'
-            f' Input rate: {sum(self.rate):,} tx/s\n'
-            f' Transaction size: {self.size[0]:,} B\n'
-            f' Faults: {self.faults} nodes\n'
+            f' Committee size: {setup["nodes"]} nodes\n'
+            f' Input rate: {setup["rate"]:,} tx/s\n'
+            f' Transaction size: {setup["tx_size"]:,} B\n'
+            f' Faults: {setup["faults"]} nodes\n'
             f' Execution time: {round(duration):,} s\n'
             '\n'
             f' Consensus timeout delay: {consensus_timeout_delay:,} ms\n'
@@ -221,29 +906,68 @@ class LogParser:
             f' Consensus TPS: {round(consensus_tps):,} tx/s\n'
             f' Consensus BPS: {round(consensus_bps):,} B/s\n'
             f' Consensus latency: {round(consensus_latency):,} ms\n'
+            f'{consensus_percentiles}'
             '\n'
             f' End-to-end TPS: {round(end_to_end_tps):,} tx/s\n'
             f' End-to-end BPS: {round(end_to_end_bps):,} B/s\n'
             f' End-to-end latency: {round(end_to_end_latency):,} ms\n'
+            f'{end_to_end_percentiles}'
+            '\n'
+            f' Steady-state TPS: {round(steady_tps):,} tx/s\n'
+            f' Steady-state window: {steady_start:,} - {steady_end:,} s\n'
+            f'{stages}'
+            f'{cls._format_view_changes(metrics["view_change_report"])}'
+            f'{cls._format_nodes(metrics["node_breakdown"])}'
+            f'{cls._format_resources(metrics["resources"], record.get("hosts", []))}'
+            f'{cls._format_placement(metrics["placement"])}'
+            f'{cls._format_profiles(metrics["profiles"])}'
             '-----------------------------------------\n'
         )
 
+    def result(self):
+        return self.render(self.record())
+
     def print(self, filename):
         assert isinstance(filename, str)
+        if self.profiles:
+            run = f'{splitext(basename(filename))[0]}-{int(time())}'
+            self.profile_files = self._print_profiles(run)
+
+        record = self.record()
         with open(filename, 'a') as f:
-            f.write(self.result())
+            f.write(self.render(record))
+
+        # Keep the record of the run; it is the input of the aggregation
+        # and plots.
+        try:
+            with ResultsDB(PathMaker.results_db()) as db:
+                db.insert_record(record)
+        except DatabaseError as e:
+            Print.warn(f'Failed to record run: {e}')
+
+    @staticmethod
+    def _natural_key(filename):
+        # Sort node-2 before node-10.
+        return [int(x) if x.isdigit() else x for x in split(r'(\d+)', filename)]
 
     @classmethod
-    def process(cls, directory, faults=0):
+    def process(cls, directory, faults=0, regions=[], placement={}, hosts=[], bench={}, cache=False):
+        ''' Parse the logs in `directory`. With `cache`, the result of parsing
+        every file is kept on disk, so re-analysing the logs only parses the
+        files that are new or changed. '''
         assert isinstance(directory, str)
 
-        clients = []
-        for filename in sorted(glob(join(directory, 'client-*.log'))):
-            with open(filename, 'r') as f:
-                clients += [f.read()]
-        nodes = []
-        for filename in sorted(glob(join(directory, 'node-*.log'))):
-            with open(filename, 'r') as f:
-                nodes += [f.read()]
+        def files(pattern):
+            return sorted(glob(join(directory, pattern)), key=cls._natural_key)
 
-        return cls(clients, nodes, faults=faults)
+        clients = files('client-*.log*')
+        nodes = files('node-*.log*')
+        resources = files('resources-*.log*')
+        profiles = files('profile-*.log*')
+
+        return cls(
+            clients, nodes, faults=faults, resources=resources,
+            profiles=profiles, regions=regions, placement=placement,
+            hosts=hosts, bench=bench,
+            cache=ParseCache(PathMaker.parse_cache_path()) if cache else None
+        )
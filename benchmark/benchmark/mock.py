@@ -0,0 +1,287 @@
+import random
+from base64 import b64encode
+from collections import deque
+from datetime import datetime, timezone
+from heapq import heappop, heappush
+from math import inf
+from os import makedirs
+from os.path import join
+
+from benchmark.config import BenchParameters, ConfigError, NodeParameters
+from benchmark.utils import BenchError
+
+# The clients send their transactions in bursts (see node/src/client.rs).
+PRECISION = 20  # Bursts per second.
+BURST_DURATION = 1 / PRECISION  # s
+DIGEST_SIZE = 32  # B
+
+
+class MockLog:
+    ''' A log file written in the format of env_logger (with millisecond
+    timestamps), as the nodes and clients do. The simulation does not log
+    in time order, so the lines are buffered until `flush` writes them
+    sorted by time (lines with the same time keep their order). '''
+
+    def __init__(self, filename):
+        self.file = open(filename, 'w')
+        self.seconds = None, None  # Cache the formatting of the last second.
+        self.pending = []  # A heap of (time, sequence, line).
+        self.sequence = 0
+
+    def _timestamp(self, t):
+        second, ms = divmod(round(t * 1000), 1000)
+        if self.seconds[0] != second:
+            date = datetime.fromtimestamp(second, timezone.utc)
+            self.seconds = second, date.strftime('%Y-%m-%dT%H:%M:%S')
+        return f'{self.seconds[1]}.{ms:03d}Z'
+
+    def _log(self, t, level, target, message):
+        heappush(self.pending, (t, self.sequence, level, target, message))
+        self.sequence += 1
+
+    def info(self, t, target, message):
+        self._log(t, 'INFO ', target, message)
+
+    def warn(self, t, target, message):
+        self._log(t, 'WARN ', target, message)
+
+    def flush(self, until=inf):
+        ''' Write the buffered lines up to time `until`. '''
+        while self.pending and self.pending[0][0] <= until:
+            t, _, level, target, message = heappop(self.pending)
+            self.file.write(f'[{self._timestamp(t)} {level} {target}] {message}\n')
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class MockBench:
+    ''' Write the logs of a simulated benchmark run in exactly the format of
+    the nodes and clients (compiled with the `benchmark` feature), to test
+    and benchmark the harness itself without running a testbed. The mock
+    follows the real protocol closely enough for the analytics to be
+    meaningful: the clients send bursts of transactions (with one sample tx
+    per burst), the mempools seal full payloads, the round-robin leaders
+    propose them, and blocks commit with the 2-chain rule. Faulty nodes do
+    not boot, so the rounds they lead time out; `timeouts` extra rounds
+    (picked at random) time out as well.
+
+    The logs are streamed to disk, so long runs at high rates yield inputs
+    of any size (eg. to benchmark the parser on GBs of logs). '''
+
+    SYNC_DELAY = 0.1  # s, for the clients to see all the nodes online.
+    SEAL_DELAY = 0.001  # s, to hash and sign a payload.
+    JITTER = 0.1  # Relative jitter of the network delays.
+
+    def __init__(self, bench_parameters_dict, node_parameters_dict, latency=10, timeouts=0, seed=0):
+        try:
+            self.bench_parameters = BenchParameters(bench_parameters_dict)
+            self.node_parameters = NodeParameters(node_parameters_dict)
+        except ConfigError as e:
+            raise BenchError('Invalid nodes or bench parameters', e)
+        assert isinstance(latency, (int, float)) and latency >= 0
+        assert isinstance(timeouts, int) and timeouts >= 0
+
+        self.committee_size = self.bench_parameters.nodes[0]
+        self.faults = self.bench_parameters.faults
+        self.nodes = self.committee_size - self.faults
+        if self.nodes < 1:
+            raise BenchError(
+                'Invalid bench parameters',
+                ConfigError('The mock needs at least one correct node')
+            )
+
+        # Like the local benchmarks, split the rate among the clients.
+        rate = self.bench_parameters.rate[0]
+        self.rate = -(-rate // self.nodes)
+        self.burst = self.rate // PRECISION
+        if self.burst < 1:
+            raise BenchError('Invalid bench parameters', ConfigError(
+                f'The rate of each client must be at least {PRECISION} tx/s'
+            ))
+
+        self.tx_size = self.bench_parameters.tx_size
+        self.duration = self.bench_parameters.duration
+        self.latency = latency / 1000
+        self.timeouts = timeouts
+        self.random = random.Random(seed)
+
+        json = self.node_parameters.json
+        self.timeout_delay = json['consensus']['timeout_delay'] / 1000
+        self.block_delay = json['consensus']['min_block_delay'] / 1000
+        self.max_digests = max(
+            1, json['consensus']['max_payload_size'] // DIGEST_SIZE
+        )
+        self.payload_txs = max(
+            1, json['mempool']['max_payload_size'] // self.tx_size
+        )
+
+    def _digest(self):
+        return b64encode(self.random.getrandbits(8 * DIGEST_SIZE).to_bytes(
+            DIGEST_SIZE, 'big'
+        )).decode()
+
+    def _delay(self):
+        return self.latency * (1 + self.random.uniform(-1, 1) * self.JITTER)
+
+    def _boot(self, node, client, i, start):
+        # The nodes print their parameters and the clients wait for them to
+        # be online and synchronized before sending transactions.
+        json = self.node_parameters.json
+        consensus, mempool = json['consensus'], json['mempool']
+        for message in [
+            f'Consensus timeout delay set to {consensus["timeout_delay"]} ms',
+            'Consensus synchronizer retry delay set to '
+            f'{consensus["sync_retry_delay"]} ms',
+            f'Consensus max payload size set to {consensus["max_payload_size"]} B',
+            f'Consensus min block delay set to {consensus["min_block_delay"]} ms',
+        ]:
+            node.info(start, 'consensus::consensus', message)
+        for message in [
+            f'Mempool queue capacity set to {mempool["queue_capacity"]} payloads',
+            'Mempool synchronizer retry delay set to '
+            f'{mempool["sync_retry_delay"]} ms',
+            f'Mempool max payload size set to {mempool["max_payload_size"]} B',
+            f'Mempool min block delay set to {mempool["min_block_delay"]} ms',
+        ]:
+            node.info(start, 'mempool::mempool', message)
+        name = b64encode(self.random.getrandbits(256).to_bytes(32, 'big'))
+        node.info(start, 'node::node', f'Node {name.decode()} successfully booted')
+
+        client.info(start, 'client', f'Node address: 127.0.0.1:{7000 + i}')
+        client.info(start, 'client', f'Transactions size: {self.tx_size} B')
+        client.info(start, 'client', f'Transactions rate: {self.rate} tx/s')
+        client.info(start, 'client', 'Waiting for all nodes to be online...')
+        client.info(
+            start + self.SYNC_DELAY, 'client',
+            'Waiting for all nodes to be synchronized...'
+        )
+
+    def _payloads(self, node, client, start):
+        # Yield the (seal time, digest) of the payloads of a correct node as
+        # its client fills them, logging the sample txs along the way.
+        client.info(start, 'client', 'Start sending transactions')
+        samples = deque()  # The (position, id) of the sample txs in flight.
+        sent, sealed, counter = 0, 0, 0
+        while True:
+            t = start + counter * BURST_DURATION
+            samples.append((sent + counter % self.burst, counter))
+            client.info(t, 'client', f'Sending sample transaction {counter}')
+            sent += self.burst
+            counter += 1
+
+            # A payload is sealed when the next tx would not fit.
+            while sent > (sealed + 1) * self.payload_txs:
+                end = (sealed + 1) * self.payload_txs
+                seal = t + self.SEAL_DELAY
+                digest = self._digest()
+                node.info(
+                    seal, 'mempool::core',
+                    f'Payload {digest} contains {self.payload_txs * self.tx_size} B'
+                )
+                while samples and samples[0][0] < end:
+                    _, tx_id = samples.popleft()
+                    node.info(
+                        seal, 'mempool::core',
+                        f'Payload {digest} contains sample tx {tx_id}'
+                    )
+                sealed += 1
+                yield seal, digest
+
+    def print(self, directory):
+        ''' Write the logs of the run into `directory`. '''
+        assert isinstance(directory, str)
+        makedirs(directory, exist_ok=True)
+        nodes = [
+            MockLog(join(directory, f'node-{i}.log')) for i in range(self.nodes)
+        ]
+        clients = [
+            MockLog(join(directory, f'client-{i}.log')) for i in range(self.nodes)
+        ]
+        try:
+            self._simulate(nodes, clients)
+        finally:
+            for log in nodes + clients:
+                log.close()
+
+    def _simulate(self, nodes, clients):
+        now = datetime.now(timezone.utc).timestamp()
+        for i, (node, client) in enumerate(zip(nodes, clients)):
+            self._boot(node, client, i, now)
+
+        # Like the real nodes, time out once at the beginning. The clients
+        # start sending once the nodes are synchronized.
+        t = now + self.timeout_delay
+        for node in nodes:
+            node.warn(t, 'consensus::core', 'Timeout reached for round 1')
+        start = now + self.SYNC_DELAY + 2 * self.timeout_delay
+        end = start + self.duration
+
+        payloads = [
+            self._payloads(x, y, start) for x, y in zip(nodes, clients)
+        ]
+        heads = [next(x) for x in payloads]
+        pending = []  # The payloads not yet proposed (a heap, by seal time).
+
+        round_time = self.block_delay + 2 * self.latency
+        rounds = int(self.duration / max(round_time, 0.001)) + 2
+        skipped = set(self.random.sample(
+            range(2, rounds), min(self.timeouts, rounds - 2)
+        ))
+        chain = []  # The (round, time, digests) of the uncommitted blocks.
+        r = 2
+        while t < end:
+            # Gather the payloads the leader received.
+            for i in range(self.nodes):
+                while heads[i][0] + self.latency <= t:
+                    heappush(pending, heads[i])
+                    heads[i] = next(payloads[i])
+
+            # Nothing is logged before the current round, nor before the
+            # bursts of the next payloads (sealed after their last burst).
+            until = min([t] + [x[0] for x in heads]) - self.SEAL_DELAY
+            for log in nodes + clients:
+                log.flush(until)
+
+            leader = r % self.committee_size
+            if leader >= self.nodes or r in skipped:
+                t += self.timeout_delay
+                for node in nodes:
+                    node.warn(
+                        t + self._delay(), 'consensus::core',
+                        f'Timeout reached for round {r}'
+                    )
+                r += 1
+                continue
+
+            t += self.block_delay
+            digests = [
+                heappop(pending)[1]
+                for _ in range(min(self.max_digests, len(pending)))
+            ]
+            if digests:
+                nodes[leader].info(t, 'consensus::core', f'Created B{r}')
+                for d in digests:
+                    nodes[leader].info(t, 'consensus::core', f'Created B{r}({d})')
+            chain += [(r, t, digests)]
+
+            # Commit the grand-parent (and its uncommitted ancestors) when
+            # the parent directly extends it.
+            if len(chain) > 2 and chain[-3][0] + 1 == chain[-2][0]:
+                blocks, chain = chain[:-2], chain[-2:]
+                for node in nodes:
+                    delay = self._delay()
+                    for round, _, digests in blocks:
+                        if not digests:
+                            continue
+                        node.info(t + delay, 'consensus::core', f'Committed B{round}')
+                        for d in digests:
+                            node.info(
+                                t + delay, 'consensus::core',
+                                f'Committed B{round}({d})'
+                            )
+
+            # The next leader gathers the votes into a certificate.
+            t += self._delay() + self._delay()
+            r += 1
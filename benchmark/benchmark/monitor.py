@@ -0,0 +1,154 @@
+from collections import deque
+from os.path import basename
+from re import compile
+from time import sleep, time
+
+from benchmark.logs import LogParser
+from benchmark.utils import Print
+
+LOG_NAME = compile(r'(node|client)-(\d+)\.log')
+
+
+class MonitorError(Exception):
+    pass
+
+
+class LocalReader:
+    ''' Return the text appended to local log files since the last call. '''
+
+    def __init__(self, filenames):
+        assert isinstance(filenames, list)
+        self.filenames = filenames
+        self.files = {}
+
+    def __call__(self):
+        chunks = []
+        for filename in self.filenames:
+            if filename not in self.files:
+                try:
+                    self.files[filename] = open(filename, 'r')
+                except FileNotFoundError:
+                    continue
+            chunks += [(filename, self.files[filename].read())]
+        return chunks
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+class LogMonitor:
+    ''' Incrementally parse the logs of a running benchmark (with the same
+    rules as the LogParser), print the rolling throughput, latency, and
+    timeouts, and abort the run if a node panics or the commits stall. '''
+
+    POLL_INTERVAL = 1  # s
+    ROLLING_WINDOW = 5  # s, of log time.
+    STALL_TIMEOUT = 10  # s, without any new commit.
+
+    def __init__(self, reader, tx_size, timeout_delay):
+        assert callable(reader)
+        assert isinstance(tx_size, int) and tx_size > 0
+        self.reader = reader
+        self.tx_size = tx_size
+        self.stall_timeout = max(self.STALL_TIMEOUT, 3 * timeout_delay / 1000)
+
+        self.buffers = {}  # The incomplete last line of each log.
+        self.commits, self.sizes, self.samples = {}, {}, {}
+        self.recent = deque()  # The (time, digest) of the latest commits.
+        self.sent = {}  # The sample txs sent by each client.
+        self.timeouts = set()
+        self.misses = 0
+        self.now = 0  # The latest log time.
+        self.last_commit = time()  # The wall-clock time of the last commit.
+
+    def _feed(self, filename, text):
+        match = LOG_NAME.search(basename(filename))
+        if match is None:
+            return
+        kind, index = match.group(1), int(match.group(2))
+
+        lines = (self.buffers.pop(filename, '') + text).split('\n')
+        self.buffers[filename] = lines.pop()
+        for line in lines:
+            if kind == 'node':
+                self._parse_node(line, index)
+            else:
+                self._parse_client(line, index)
+
+    def _parse_client(self, line, index):
+        rule, values = LogParser.match_client_line(line)
+        if rule == 'sample':
+            t, s = values
+            self.sent.setdefault(index, {})[int(s)] = LogParser._to_posix(t)
+        elif rule == 'miss':
+            self.misses += 1
+        elif rule == 'error':
+            raise MonitorError(f'Client {index} panicked: {line}')
+
+    def _parse_node(self, line, index):
+        rule, values = LogParser.match_node_line(line)
+        if rule == 'sample':
+            d, s = values
+            self.samples.setdefault(d, []).append((index, int(s)))
+        elif rule == 'size':
+            d, s = values
+            self.sizes[d] = int(s)
+        elif rule == 'block' and values[1] == 'Committed':
+            t, _, _, d = values
+            t = LogParser._to_posix(t)
+            if d not in self.commits:
+                self.commits[d] = t
+                self.recent.append((t, d))
+                self.now = max(self.now, t)
+                self.last_commit = time()
+            elif t < self.commits[d]:
+                self.commits[d] = t  # Keep the earliest commit.
+        elif rule == 'timeout':
+            self.timeouts.add(int(values[1]))
+        elif rule == 'panic':
+            raise MonitorError(f'Node {index} panicked: {line}')
+
+    def _rolling(self):
+        # Throughput and end-to-end latency over the rolling window.
+        while self.recent and self.recent[0][0] < self.now - self.ROLLING_WINDOW:
+            self.recent.popleft()
+        bytes, latency = 0, []
+        for _, d in self.recent:
+            bytes += self.sizes.get(d, 0)
+            for i, tx_id in self.samples.get(d, []):
+                sent = self.sent.get(i, {}).get(tx_id)
+                if sent is not None:
+                    latency += [self.commits[d] - sent]
+        tps = bytes / self.tx_size / self.ROLLING_WINDOW
+        latency = sum(latency) / len(latency) * 1000 if latency else 0
+        return tps, latency
+
+    def run(self, duration):
+        ''' Follow the logs for `duration` seconds. Raises MonitorError as
+        soon as the run is known to be broken. '''
+        start = time()
+        while time() - start < duration:
+            sleep(min(self.POLL_INTERVAL, max(0, duration - time() + start)))
+            for filename, text in self.reader():
+                self._feed(filename, text)
+
+            tps, latency = self._rolling()
+            print(
+                f'\r {time() - start:,.0f}/{duration:,} s: '
+                f'{round(tps):,} tx/s, {round(latency):,} ms, '
+                f'{len(self.timeouts):,} timeout(s), '
+                f'{self.misses:,} rate miss(es)   ',
+                end=''
+            )
+
+            if time() - self.last_commit > self.stall_timeout:
+                print()
+                raise MonitorError(
+                    f'No commit for {self.stall_timeout:,.0f} s'
+                )
+        print()
+        Print.info(
+            f'Committed {len(self.commits):,} payloads, '
+            f'{len(self.timeouts):,} round(s) timed out'
+        )
@@ -0,0 +1,80 @@
+import os
+
+from benchmark.commands import CommandMaker
+from benchmark.config import ConfigError
+
+
+class Placement:
+    ''' Assign dedicated CPU sets (and, with cgroups, memory caps) to the
+    nodes and clients of a local testbed. Each client gets `client_cpus`
+    CPUs and the nodes evenly share the remaining ones. '''
+
+    MODES = ['taskset', 'cgroup']
+
+    def __init__(self, mode, nodes, cpus=None, client_cpus=1, node_memory=None):
+        assert mode in self.MODES
+        assert isinstance(nodes, int) and nodes > 0
+        assert isinstance(client_cpus, int) and client_cpus > 0
+        assert node_memory is None or mode == 'cgroup'
+        self.mode = mode
+        self.node_memory = node_memory
+
+        available = self.parse(cpus) if cpus is not None \
+            else sorted(os.sched_getaffinity(0))
+        per_node = (len(available) - nodes * client_cpus) // nodes
+        if per_node < 1:
+            raise ConfigError(
+                f'Not enough CPUs ({len(available)}) to isolate {nodes} '
+                f'nodes and clients'
+            )
+        self.nodes = [
+            available[i * per_node:(i + 1) * per_node] for i in range(nodes)
+        ]
+        offset = nodes * per_node
+        self.clients = [
+            available[offset + i * client_cpus:offset + (i + 1) * client_cpus]
+            for i in range(nodes)
+        ]
+
+    @staticmethod
+    def parse(cpus):
+        # Parse a CPU list such as '0-3,8'.
+        assert isinstance(cpus, str)
+        parsed = []
+        for x in cpus.split(','):
+            start, _, end = x.strip().partition('-')
+            parsed += range(int(start), int(end or start) + 1)
+        return parsed
+
+    @staticmethod
+    def format(cpus):
+        # Format a CPU list compactly, eg. [0, 1, 2, 3, 8] as '0-3,8'.
+        ranges = []
+        for x in cpus:
+            if ranges and ranges[-1][1] == x - 1:
+                ranges[-1][1] = x
+            else:
+                ranges += [[x, x]]
+        return ','.join(f'{x}' if x == y else f'{x}-{y}' for x, y in ranges)
+
+    def _wrap(self, command, cpus, memory=None):
+        cpus = self.format(cpus)
+        if self.mode == 'taskset':
+            return CommandMaker.pin(command, cpus)
+        return CommandMaker.cgroup(command, cpus, memory)
+
+    def node(self, i, command):
+        return self._wrap(command, self.nodes[i], self.node_memory)
+
+    def client(self, i, command):
+        return self._wrap(command, self.clients[i])
+
+    def describe(self):
+        placement = {'mode': self.mode}
+        for i, cpus in enumerate(self.nodes):
+            placement[f'node-{i}'] = {
+                'cpus': self.format(cpus), 'memory': self.node_memory
+            }
+        for i, cpus in enumerate(self.clients):
+            placement[f'client-{i}'] = {'cpus': self.format(cpus), 'memory': None}
+        return placement
@@ -1,12 +1,14 @@
-from re import findall, search, split
+from re import split
 import matplotlib.pyplot as plt
 from matplotlib.ticker import StrMethodFormatter
-from glob import glob
 from itertools import cycle
+import os
 
 from benchmark.utils import PathMaker
 from benchmark.config import PlotParameters
 from benchmark.aggregate import LogAggregator
+from benchmark.database import DatabaseError
+from benchmark.records import RecordError
 
 
 class PlotError(Exception):
@@ -14,57 +16,58 @@ class PlotError(Exception):
 
 
 class Ploter:
-    def __init__(self, filenames):
-        if not filenames:
+    def __init__(self, records):
+        if not records:
             raise PlotError('No data to plot')
 
-        self.results = []
-        try:
-            for filename in filenames:
-                with open(filename, 'r') as f:
-                    self.results += [f.read().replace(',', '')]
-        except OSError as e:
-            raise PlotError(f'Failed to load log files: {e}')
+        # Each record is a (setup, values) pair produced by the LogAggregator
+        # where values is a list of (variable, result) pairs.
+        self.results = records
 
-    def _natural_keys(self, text):
+    def _natural_keys(self, record):
         def try_cast(text): return int(text) if text.isdigit() else text
-        return [try_cast(c) for c in split('(\d+)', text)]
+        return [try_cast(c) for c in split('(\d+)', str(record[0]))]
 
-    def _tps(self, data):
-        values = findall(r' TPS: (\d+) \+/- (\d+)', data)
-        values = [(int(x), int(y)) for x, y in values]
+    def _tps(self, values):
+        values = [(x.mean_tps, x.std_tps) for _, x in values]
         return list(zip(*values))
 
-    def _latency(self, data, scale=1):
-        values = findall(r' Latency: (\d+) \+/- (\d+)', data)
-        values = [(float(x)/scale, float(y)/scale) for x, y in values]
+    def _latency(self, values, scale=1):
+        values = [
+            (x.mean_latency / scale, x.std_latency / scale) for _, x in values
+        ]
         return list(zip(*values))
 
-    def _variable(self, data):
-        return [int(x) for x in findall(r'Variable value: X=(\d+)', data)]
+    def _tail_latency(self, values, percentile='p99'):
+        values = [
+            x.percentiles[percentile] for _, x in values
+            if percentile in x.percentiles
+        ]
+        return values, [0] * len(values)
+
+    def _variable(self, values):
+        return [x for x, _ in values]
 
     def _tps2bps(self, x):
-        data = self.results[0]
-        size = int(search(r'Transaction size: (\d+)', data).group(1))
+        size = self.results[0][0].tx_size
         return x * size / 10**6
 
     def _bps2tps(self, x):
-        data = self.results[0]
-        size = int(search(r'Transaction size: (\d+)', data).group(1))
+        size = self.results[0][0].tx_size
         return x * 10**6 / size
 
     def _plot(self, x_label, y_label, y_axis, z_axis, type):
         plt.figure()
         markers = cycle(['o', 'v', 's', 'p', 'D', 'P'])
         self.results.sort(key=self._natural_keys, reverse=(type == 'tps'))
-        for result in self.results:
-            y_values, y_err = y_axis(result)
-            x_values = self._variable(result)
+        for setup, values in self.results:
+            y_values, y_err = y_axis(values)
+            x_values = self._variable(values)
             if len(y_values) != len(y_err) or len(y_err) != len(x_values):
                 raise PlotError('Unequal number of x, y, and y_err values')
 
             plt.errorbar(
-                x_values, y_values, yerr=y_err, label=z_axis(result),
+                x_values, y_values, yerr=y_err, label=z_axis(setup),
                 linestyle='dotted', marker=next(markers), capsize=3
             )
 
@@ -88,49 +91,105 @@ class Ploter:
             plt.savefig(PathMaker.plot_file(type, x), bbox_inches='tight')
 
     @staticmethod
-    def nodes(data):
-        x = search(r'Committee size: (\d+)', data).group(1)
-        f = search(r'Faults: (\d+)', data).group(1)
-        faults = f'({f} faulty)' if f != '0' else ''
-        return f'{x} nodes {faults}'
+    def nodes(setup):
+        faults = f'({setup.faults} faulty)' if setup.faults != 0 else ''
+        return f'{setup.nodes} nodes {faults}'
 
     @staticmethod
-    def max_latency(data):
-        x = search(r'Max latency: (\d+)', data).group(1)
-        f = search(r'Faults: (\d+)', data).group(1)
-        faults = f'({f} faulty)' if f != '0' else ''
-        return f'Max latency: {float(x) / 1000:,.1f} s {faults}'
+    def max_latency(setup):
+        faults = f'({setup.faults} faulty)' if setup.faults != 0 else ''
+        return f'Max latency: {setup.max_latency / 1000:,.1f} s {faults}'
 
     @classmethod
-    def plot_robustness(cls, files):
-        assert isinstance(files, list)
-        assert all(isinstance(x, str) for x in files)
+    def plot_robustness(cls, records):
+        assert isinstance(records, list)
         z_axis = cls.nodes
         x_label = 'Input rate (tx/s)'
         y_label = ['Throughput (tx/s)', 'Throughput (MB/s)']
-        ploter = cls(files)
+        ploter = cls(records)
         ploter._plot(x_label, y_label, ploter._tps, z_axis, 'robustness')
 
     @classmethod
-    def plot_latency(cls, files):
-        assert isinstance(files, list)
-        assert all(isinstance(x, str) for x in files)
+    def plot_latency(cls, records):
+        assert isinstance(records, list)
         z_axis = cls.nodes
         x_label = 'Throughput (tx/s)'
         y_label = ['Latency (ms)']
-        ploter = cls(files)
+        ploter = cls(records)
         ploter._plot(x_label, y_label, ploter._latency, z_axis, 'latency')
 
     @classmethod
-    def plot_tps(cls, files):
-        assert isinstance(files, list)
-        assert all(isinstance(x, str) for x in files)
+    def plot_tail_latency(cls, records):
+        assert isinstance(records, list)
+        z_axis = cls.nodes
+        x_label = 'Throughput (tx/s)'
+        y_label = ['Latency p99 (ms)']
+
+        # Older results do not report tail latency.
+        records = [
+            (setup, values) for setup, values in records
+            if all('p99' in x.percentiles for _, x in values)
+        ]
+        if not records:
+            return
+        ploter = cls(records)
+        ploter._plot(
+            x_label, y_label, ploter._tail_latency, z_axis, 'latency-p99'
+        )
+
+    @classmethod
+    def plot_tps(cls, records):
+        assert isinstance(records, list)
         z_axis = cls.max_latency
         x_label = 'Committee size'
         y_label = ['Throughput (tx/s)', 'Throughput (MB/s)']
-        ploter = cls(files)
+        ploter = cls(records)
         ploter._plot(x_label, y_label, ploter._tps, z_axis, 'tps')
 
+    @staticmethod
+    def plot_timeline(timeline):
+        assert isinstance(timeline, list)
+        if not timeline:
+            raise PlotError('No data to plot')
+
+        if not os.path.exists(PathMaker.plots_path()):
+            os.makedirs(PathMaker.plots_path())
+
+        # Save the per-window series.
+        keys = list(timeline[0].keys())
+        with open(PathMaker.timeline_file(), 'w') as f:
+            f.write(','.join(keys) + '\n')
+            for x in timeline:
+                f.write(','.join(str(x[k]) for k in keys) + '\n')
+
+        x_values = [x['start'] for x in timeline]
+        timeouts = [x['start'] for x in timeline if x['timeouts']]
+
+        _, (tps, latency) = plt.subplots(2, 1, sharex=True)
+        tps.plot(x_values, [x['tps'] for x in timeline], drawstyle='steps-post')
+        tps.set_ylabel('Throughput (tx/s)')
+        latency.plot(
+            x_values, [x['latency'] for x in timeline],
+            drawstyle='steps-post', label='Mean'
+        )
+        latency.plot(
+            x_values, [x['latency_p99'] for x in timeline],
+            drawstyle='steps-post', linestyle='dotted', label='p99'
+        )
+        latency.set_ylabel('Latency (ms)')
+        latency.set_xlabel('Time (s)')
+        latency.legend(loc='upper right')
+        for ax in [tps, latency]:
+            for x in timeouts:
+                ax.axvline(x, color='tab:red', linestyle='dashed', alpha=0.5)
+            ax.set_xlim(xmin=0)
+            ax.set_ylim(bottom=0)
+            ax.grid()
+            ax.yaxis.set_major_formatter(StrMethodFormatter('{x:,.0f}'))
+
+        for x in ['pdf', 'png']:
+            plt.savefig(PathMaker.plot_file('timeline', x), bbox_inches='tight')
+
     @classmethod
     def plot(cls, params_dict):
         try:
@@ -138,27 +197,35 @@ class Ploter:
         except PlotError as e:
             raise PlotError('Invalid nodes or bench parameters', e)
 
-        # Aggregate the logs.
-        LogAggregator(params.max_latency).print()
-
-        # Load the aggregated log files.
-        robustness_files, latency_files, tps_files = [], [], []
-        tx_size = params.tx_size
-        
-        for f in params.faults:
-            for n in params.nodes:
-                robustness_files += glob(
-                    PathMaker.agg_file('robustness', n, 'x', tx_size, f, 'any')
-                )
-                latency_files += glob(
-                    PathMaker.agg_file('latency', n, 'any', tx_size, f, 'any')
-                )
-            for l in params.max_latency:
-                tps_files += glob(
-                    PathMaker.agg_file('tps', 'x', 'any', tx_size, f, l)
-                )
+        # Aggregate the results.
+        try:
+            aggregator = LogAggregator(
+                params.max_latency,
+                nodes=params.nodes,
+                tx_size=params.tx_size,
+                faults=params.faults
+            )
+        except (DatabaseError, RecordError) as e:
+            raise PlotError(f'Failed to load results: {e}')
+        aggregator.print()
+        results = dict(aggregator.results())
+
+        # Select the records to plot.
+        robustness = [
+            (k, v) for k, v in results['robustness'].items()
+            if k.nodes in params.nodes
+        ]
+        latency = [
+            (k, v) for k, v in results['latency'].items()
+            if k.nodes in params.nodes
+        ]
+        tps = [
+            (k, v) for k, v in results['tps'].items()
+            if k.max_latency in params.max_latency
+        ]
 
         # Make the plots.
-        cls.plot_robustness(robustness_files)
-        cls.plot_latency(latency_files)
-        cls.plot_tps(tps_files)
+        cls.plot_robustness(robustness)
+        cls.plot_latency(latency)
+        cls.plot_tail_latency(latency)
+        cls.plot_tps(tps)
@@ -0,0 +1,117 @@
+from json import JSONDecodeError, dumps, loads
+from os import makedirs
+from os.path import dirname, exists
+
+
+class RecordError(Exception):
+    pass
+
+
+class RunRecords:
+    ''' The structured records of runs as JSON lines, one object per run.
+    Each record holds the setup (nodes, rate, tx_size, faults), the node and
+    bench parameters, the hosts, the timestamps, and all the metrics
+    computed by the LogParser. The runs are stored in the ResultsDB; this
+    is its export format (and a legacy store it imports). '''
+
+    SETUP = ['nodes', 'rate', 'tx_size', 'faults']
+
+    def __init__(self, filename):
+        assert isinstance(filename, str)
+        self.filename = filename
+
+    def append(self, record):
+        assert isinstance(record, dict)
+        assert all(x in record['setup'] for x in self.SETUP)
+        try:
+            if dirname(self.filename):
+                makedirs(dirname(self.filename), exist_ok=True)
+            with open(self.filename, 'a') as f:
+                f.write(dumps(record) + '\n')
+        except (OSError, TypeError, ValueError) as e:
+            raise RecordError(f'Failed to record run: {e}')
+
+    def load(self, **filters):
+        ''' Return all records matching the filters. Each filter is either a
+        single value or a list of accepted values for a setup key. '''
+        assert all(x in self.SETUP for x in filters)
+        filters = {
+            k: v if isinstance(v, list) else [v] for k, v in filters.items()
+        }
+        if not exists(self.filename):
+            return []
+
+        records = []
+        try:
+            with open(self.filename, 'r') as f:
+                for i, line in enumerate(f):
+                    if not line.strip():
+                        continue
+                    record = loads(line)
+                    if all(record['setup'][k] in v for k, v in filters.items()):
+                        records += [record]
+        except OSError as e:
+            raise RecordError(f'Failed to load records: {e}')
+        except (JSONDecodeError, KeyError) as e:
+            raise RecordError(f'Malformed record on line {i + 1}: {e}')
+        return records
+
+    def count(self):
+        return len(self.load())
+
+    @staticmethod
+    def flatten(record):
+        ''' Flatten a record into a row of scalar columns (eg. the metric
+        `end_to_end_percentiles.p99`); lists are kept as JSON strings. '''
+        row = {}
+
+        def visit(prefix, value):
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    visit(f'{prefix}{k}.', v)
+            elif isinstance(value, list):
+                row[prefix[:-1]] = dumps(value)
+            else:
+                row[prefix[:-1]] = value
+
+        for key in ['setup', 'metrics']:
+            visit('', record[key])
+        visit('parameters.', record['parameters'])
+        visit('bench.', record.get('bench', {}))
+        for key in ['timestamp', 'start', 'end', 'commit_hash']:
+            row[key] = record.get(key)
+        row['hosts'] = dumps(record.get('hosts', []))
+        return row
+
+    def write(self, records):
+        ''' Replace the content of the file with the records. '''
+        try:
+            if dirname(self.filename):
+                makedirs(dirname(self.filename), exist_ok=True)
+            with open(self.filename, 'w') as f:
+                for record in records:
+                    f.write(dumps(record) + '\n')
+        except (OSError, TypeError, ValueError) as e:
+            raise RecordError(f'Failed to write records: {e}')
+
+    @classmethod
+    def export(cls, records, filename):
+        ''' Write the records as a columnar (Parquet) table. This requires
+        pyarrow, which the rest of the harness does not need. '''
+        assert isinstance(filename, str)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RecordError('Exporting to Parquet requires pyarrow')
+
+        rows = [cls.flatten(x) for x in records]
+        columns = list(dict.fromkeys(k for x in rows for k in x))
+        table = pyarrow.table({k: [x.get(k) for x in rows] for k in columns})
+        try:
+            if dirname(filename):
+                makedirs(dirname(filename), exist_ok=True)
+            pyarrow.parquet.write_table(table, filename)
+        except (OSError, pyarrow.ArrowException) as e:
+            raise RecordError(f'Failed to export records: {e}')
+        return len(rows)
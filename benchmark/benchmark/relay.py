@@ -0,0 +1,97 @@
+''' Userspace WAN emulator relaying the TCP connections between local nodes.
+
+Usage: python3 relay.py <config file>
+
+The config file lists the links to emulate, as
+{"links": [{"port": 7100, "target": "127.0.0.1:7001", "delay": 50,
+"jitter": 5, "bandwidth": 100, "loss": 0.001}, ...]}: the relay listens on
+`port` and forwards every connection to `target`, delaying the data of both
+directions by `delay` +/- `jitter` ms, serializing it at `bandwidth` Mb/s (if
+set), and delaying a `loss` fraction of the chunks by a retransmission
+timeout (TCP streams cannot drop data). This script only uses the standard
+library so that it runs without any setup. '''
+
+import asyncio
+import random
+import sys
+from json import load
+
+CHUNK = 64 * 1024  # B
+MAX_QUEUED = 1024  # Chunks in flight per direction (backpressure).
+MIN_RTO = 0.2  # s, the minimum TCP retransmission timeout on Linux.
+
+
+async def pipe(reader, writer, link):
+    # Forward one direction of a connection, releasing every chunk once it
+    # crossed the emulated link. Chunks are never reordered.
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(MAX_QUEUED)
+    delay, jitter = link['delay'] / 1000, link.get('jitter', 0) / 1000
+    bandwidth = link.get('bandwidth')
+    loss = link.get('loss', 0)
+
+    async def send():
+        while True:
+            release, data = await queue.get()
+            wait = release - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+
+    sender = asyncio.create_task(send())
+    free, last = 0, 0
+    try:
+        while True:
+            data = await reader.read(CHUNK)
+            now = loop.time()
+            if bandwidth:
+                free = max(now, free) + len(data) * 8 / (bandwidth * 10**6)
+                now = free
+            release = now + max(0, delay + random.uniform(-jitter, jitter))
+            if data and loss and random.random() < loss:
+                release += MIN_RTO + 2 * delay
+            last = max(release, last)
+            await queue.put((last, data))
+            if not data:
+                break
+        await sender
+    except (ConnectionError, asyncio.CancelledError):
+        sender.cancel()
+    finally:
+        writer.close()
+
+
+async def relay(link):
+    host, port = link['target'].rsplit(':', 1)
+
+    async def handle(client_reader, client_writer):
+        try:
+            target_reader, target_writer = await asyncio.open_connection(
+                host, int(port)
+            )
+        except OSError:
+            client_writer.close()  # The node will retry.
+            return
+        await asyncio.gather(
+            pipe(client_reader, target_writer, link),
+            pipe(target_reader, client_writer, link),
+            return_exceptions=True
+        )
+
+    return await asyncio.start_server(handle, '127.0.0.1', link['port'])
+
+
+async def main():
+    with open(sys.argv[1], 'r') as f:
+        links = load(f)['links']
+    servers = [await relay(x) for x in links]
+    # Like the nodes, log to stderr so that the harness captures it.
+    print(f'Relaying {len(servers)} links', file=sys.stderr, flush=True)
+    await asyncio.gather(*(x.serve_forever() for x in servers))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
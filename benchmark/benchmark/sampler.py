@@ -0,0 +1,95 @@
+''' Lightweight resource sampler running next to a node or a client.
+
+Usage: python3 sampler.py --interval <seconds> <command...>
+
+It waits for the process running exactly <command> to start, then reads its
+CPU time, resident memory, disk I/O, and network counters from /proc at every
+interval until it exits. The network counters are those of the whole host
+(network namespace) of the process, not of the process itself. This script only uses the standard library so that
+it can run on the remote machines as is. '''
+
+import argparse
+import os
+import sys
+from time import sleep, time
+
+PID_TIMEOUT = 60  # s
+
+
+def find_process(command):
+    # Look for the process whose arguments are exactly the command (and not
+    # the shell that launched it).
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                args = f.read().decode(errors='replace').split('\0')[:-1]
+        except OSError:
+            continue
+        if args == command:
+            return int(pid)
+    return None
+
+
+def sample(pid, ticks):
+    with open(f'/proc/{pid}/stat', 'r') as f:
+        # The command name may contain spaces: skip past its parenthesis.
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / ticks
+
+    rss = 0
+    with open(f'/proc/{pid}/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) * 1024
+
+    io = {}
+    try:
+        with open(f'/proc/{pid}/io', 'r') as f:
+            for line in f:
+                key, value = line.split(':')
+                io[key] = int(value)
+    except OSError:
+        pass
+
+    # Network counters are per network namespace (ie. usually the host).
+    rx, tx = 0, 0
+    with open(f'/proc/{pid}/net/dev', 'r') as f:
+        for line in f.readlines()[2:]:
+            values = line.split(':', 1)[1].split()
+            rx, tx = rx + int(values[0]), tx + int(values[8])
+
+    return cpu, rss, io.get('read_bytes', 0), io.get('write_bytes', 0), rx, tx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    deadline = time() + PID_TIMEOUT
+    pid = find_process(args.command)
+    while pid is None:
+        if time() > deadline:
+            sys.exit(f'Error: process not found: {" ".join(args.command)}')
+        sleep(0.1)
+        pid = find_process(args.command)
+
+    # Like the nodes and clients, write to stderr so that the harness
+    # captures the output in the log files.
+    ticks = os.sysconf('SC_CLK_TCK')
+    print(f'Sampling process {pid}', file=sys.stderr, flush=True)
+    while True:
+        try:
+            values = sample(pid, ticks)
+        except (OSError, IndexError, ValueError):
+            break  # The process exited.
+        values = ' '.join(str(x) for x in values)
+        print(f'{time():.3f} {values}', file=sys.stderr, flush=True)
+        sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
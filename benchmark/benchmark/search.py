@@ -0,0 +1,95 @@
+from statistics import mean
+
+from benchmark.utils import Print
+
+
+class SaturationSearch:
+    ''' Ramp up and then bisect the input rate to find the highest throughput
+    that the system sustains under a latency bound. '''
+
+    RAMP_FACTOR = 2
+    MAX_PROBES = 12
+    MAX_RETRIES = 1  # Per probe, if the benchmark fails.
+    # A rate is sustained if the system commits at least this share of it.
+    MIN_THROUGHPUT_SHARE = 0.9
+
+    def __init__(self, rate, max_latency, tolerance):
+        assert isinstance(rate, int) and rate > 0
+        assert isinstance(max_latency, int) and max_latency > 0
+        assert isinstance(tolerance, int) and tolerance > 0
+        self.rate = rate
+        self.max_latency = max_latency
+        self.tolerance = tolerance
+        self.probes = []
+
+    def _sustained(self, offered, tps, latency):
+        return latency <= self.max_latency \
+            and tps >= self.MIN_THROUGHPUT_SHARE * offered
+
+    def run(self, probe):
+        ''' The probe runs the benchmark at the given input rate and returns
+        the metrics of every run (see LogParser.metrics), or an empty list if
+        the benchmark failed. A failed probe is retried, and the search is
+        aborted if it fails again. Returns the best sustained (rate, tps)
+        pair. '''
+        low, high, rate = 0, None, self.rate
+        best = None
+        failures = 0
+        while len(self.probes) < self.MAX_PROBES:
+            Print.heading(f'Probing input rate: {rate:,} tx/s')
+            runs = probe(rate)
+            if not runs:
+                failures += 1
+                if failures > self.MAX_RETRIES:
+                    Print.warn(f'Aborting the search: the benchmark failed at {rate:,} tx/s')
+                    break
+                continue
+            failures = 0
+
+            # The clients of faulty nodes do not run, so compare with the
+            # rate that was actually offered.
+            offered = mean(x.get('input_rate', rate) for x in runs)
+            tps = mean(x['end_to_end_tps'] for x in runs)
+            latency = mean(x['end_to_end_latency'] for x in runs)
+            sustained = self._sustained(offered, tps, latency)
+            self.probes += [(rate, tps, latency, sustained)]
+
+            if sustained:
+                low = rate
+                if best is None or tps > best[1]:
+                    best = (rate, tps)
+            else:
+                high = rate
+
+            if high is None:
+                rate *= self.RAMP_FACTOR
+            elif high - low <= self.tolerance:
+                break
+            else:
+                rate = (low + high) // 2
+
+        self.print(best)
+        return best
+
+    def print(self, best):
+        probes = '\n'.join(
+            f' {r:,} tx/s -> {round(t):,} tx/s, {round(l):,} ms'
+            f'{"" if s else " (saturated)"}'
+            for r, t, l, s in self.probes
+        )
+        best = (
+            f'{round(best[1]):,} tx/s (input rate: {best[0]:,} tx/s)'
+            if best is not None else 'none'
+        )
+        print(
+            '\n'
+            '-----------------------------------------\n'
+            ' SATURATION SEARCH:\n'
+            '-----------------------------------------\n'
+            f' Max latency: {self.max_latency:,} ms\n'
+            f' Tolerance: {self.tolerance:,} tx/s\n'
+            f' Max sustained throughput: {best}\n'
+            '\n'
+            f'{probes}\n'
+            '-----------------------------------------\n'
+        )
@@ -0,0 +1,57 @@
+from array import array
+from datetime import datetime
+
+
+class TimestampDecoder:
+    ''' Decode the timestamps of the logs (eg. 2021-01-01T12:34:56.789Z) to
+    POSIX time. The log lines share their date, hour, and minute, so the
+    epoch of every `YYYY-MM-DDTHH:MM` prefix is computed once and cached;
+    the seconds and fraction are then added with integer arithmetic, which
+    rounds exactly as `datetime.timestamp` does. As many lines also share
+    their full timestamp (eg. the commits of the payloads of a block), the
+    latest decoded timestamps are memoized as well. '''
+
+    MAX_MEMOIZED = 100_000
+
+    def __init__(self):
+        self.minutes = {}
+        self.memo = {}
+
+    @staticmethod
+    def reference(string):
+        # The straightforward (and slow) decoding.
+        x = datetime.fromisoformat(string.replace('Z', '+00:00'))
+        return datetime.timestamp(x)
+
+    def __call__(self, string):
+        x = self.memo.get(string)
+        if x is not None:
+            return x
+
+        # Expect the layout YYYY-MM-DDTHH:MM:SS.fff...Z (up to microseconds).
+        if len(string) < 22 or len(string) > 27 or string[19] != '.' \
+                or string[-1] != 'Z':
+            return self.reference(string)
+        minute = string[:16]
+        epoch = self.minutes.get(minute)
+        if epoch is None:
+            epoch = int(self.reference(f'{minute}:00Z'))
+            self.minutes[minute] = epoch
+        fraction = string[20:-1]
+        micros = int(fraction) * 10**(6 - len(fraction))
+        x = ((epoch + int(string[17:19])) * 10**6 + micros) / 10**6
+
+        # The logs are roughly ordered by time: forget the old timestamps.
+        if len(self.memo) >= self.MAX_MEMOIZED:
+            self.memo.clear()
+        self.memo[string] = x
+        return x
+
+    def decode_all(self, strings):
+        ''' Decode a sequence of timestamps into an array of POSIX times. '''
+        return array('d', map(self, strings))
+
+    def validate(self, strings):
+        ''' Return the timestamps that this decoder and the reference decode
+        differently (there should be none). '''
+        return [x for x in strings if self(x) != self.reference(x)]
@@ -14,14 +14,32 @@ class PathMaker:
     def binary_path():
         return join('..', 'target', 'release')
 
+    @staticmethod
+    def build_path():
+        return '.build'
+
     @staticmethod
     def node_crate_path():
         return join('..', 'node')
 
+    @staticmethod
+    def testbed_path(i):
+        assert isinstance(i, int) and i >= 0
+        return f'.testbed-{i}'
+
     @staticmethod
     def committee_file():
         return '.committee.json'
 
+    @staticmethod
+    def node_committee_file(i):
+        assert isinstance(i, int) and i >= 0
+        return f'.committee-{i}.json'
+
+    @staticmethod
+    def relay_config_file():
+        return '.relay.json'
+
     @staticmethod
     def parameters_file():
         return '.parameters.json'
@@ -50,16 +68,73 @@ class PathMaker:
         assert isinstance(i, int) and i >= 0
         return join(PathMaker.logs_path(), f'client-{i}.log')
 
+    @staticmethod
+    def node_resources_file(i):
+        assert isinstance(i, int) and i >= 0
+        return join(PathMaker.logs_path(), f'resources-node-{i}.log')
+
+    @staticmethod
+    def client_resources_file(i):
+        assert isinstance(i, int) and i >= 0
+        return join(PathMaker.logs_path(), f'resources-client-{i}.log')
+
+    @staticmethod
+    def perf_data_file(i):
+        assert isinstance(i, int) and i >= 0
+        return join(PathMaker.logs_path(), f'perf-node-{i}.data')
+
+    @staticmethod
+    def perf_log_file(i):
+        assert isinstance(i, int) and i >= 0
+        return join(PathMaker.logs_path(), f'perf-node-{i}.log')
+
+    @staticmethod
+    def profile_file(i):
+        assert isinstance(i, int) and i >= 0
+        return join(PathMaker.logs_path(), f'profile-node-{i}.log')
+
+    @staticmethod
+    def relay_log_file():
+        return join(PathMaker.logs_path(), 'relay.log')
+
+    @staticmethod
+    def sampler_script():
+        return join('benchmark', 'sampler.py')
+
+    @staticmethod
+    def relay_script():
+        return join('benchmark', 'relay.py')
+
+    @staticmethod
+    def compressed_file(filename):
+        assert isinstance(filename, str)
+        return f'{filename}.gz'
+
     @staticmethod
     def results_path():
         return 'results'
 
     @staticmethod
-    def result_file(nodes, rate, tx_size, faults):
+    def result_file(nodes, rate, tx_size, faults, testbed=None):
+        # Testbeds running side by side each write their own summaries.
+        suffix = '' if testbed is None else f'-testbed-{testbed}'
         return join(
-            PathMaker.results_path(), f'bench-{nodes}-{rate}-{tx_size}-{faults}.txt'
+            PathMaker.results_path(),
+            f'bench-{nodes}-{rate}-{tx_size}-{faults}{suffix}.txt'
         )
 
+    @staticmethod
+    def records_file():
+        return join(PathMaker.results_path(), 'runs.jsonl')
+
+    @staticmethod
+    def results_db():
+        return join(PathMaker.results_path(), 'results.db')
+
+    @staticmethod
+    def parse_cache_path():
+        return '.parse-cache'
+
     @staticmethod
     def plots_path():
         return 'plots'
@@ -71,6 +146,14 @@ class PathMaker:
             f'{type}-{nodes}-{rate}-{tx_size}-{faults}-{max_latency}.txt'
         )
 
+    @staticmethod
+    def timeline_file():
+        return join(PathMaker.plots_path(), 'timeline.csv')
+
+    @staticmethod
+    def flamegraph_file(run, name, ext):
+        return join(PathMaker.plots_path(), f'flamegraph-{run}-{name}.{ext}')
+
     @staticmethod
     def plot_file(name, ext):
         return join(PathMaker.plots_path(), f'{name}.{ext}')
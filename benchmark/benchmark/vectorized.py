@@ -0,0 +1,144 @@
+from math import ceil, fsum
+
+import numpy as np
+
+from benchmark.logs import PERCENTILES, LogParser
+
+
+class NumpyLogParser(LogParser):
+    ''' LogParser computing the metrics with NumPy array operations rather
+    than Python loops, for logs with millions of samples and commits. As
+    the LogParser interns the digests to integer ids, the per-payload
+    timestamps and sizes are held in arrays indexed by id (NaN for the
+    payloads that were not committed), and the joins between the logs
+    become array lookups. The summary is the same as that of the LogParser
+    (up to the rounding of the means). '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commit_times = self._align(self.commits)
+        self.committed = ~np.isnan(self.commit_times)
+        self.proposal_times = self._align(self.proposals)
+        self.sealed_times = self._align(self.sealed)
+        self.payload_sizes = self._align(self.sizes, default=0)
+        self.sample_ids, self.sample_times = self._join_samples()
+
+    @staticmethod
+    def _ids(values):
+        return np.fromiter(values, dtype=np.int64, count=len(values))
+
+    def _align(self, mapping, default=np.nan):
+        # The values of an id-keyed dict, in an array indexed by id.
+        values = np.full(self.digest_count, default, dtype=float)
+        if mapping:
+            values[self._ids(mapping.keys())] = np.fromiter(
+                mapping.values(), dtype=float, count=len(mapping)
+            )
+        return values
+
+    def _join_samples(self):
+        # Join the committed sample txs of every client with the time they
+        # were sent: the id of their payload and their sending time.
+        ids, times = [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for sent, received in zip(self.sent_samples, self.received_samples):
+            if not received:
+                continue
+            tx_ids = self._ids(received.keys())
+            digest_ids = self._ids(received.values())
+            committed = self.committed[digest_ids]
+            tx_ids, digest_ids = tx_ids[committed], digest_ids[committed]
+            if not len(tx_ids):
+                continue
+
+            sent_ids = np.fromiter(sent.keys(), dtype=np.int64, count=len(sent))
+            sent_times = np.fromiter(sent.values(), dtype=float, count=len(sent))
+            order = np.argsort(sent_ids)
+            sent_ids, sent_times = sent_ids[order], sent_times[order]
+            index = np.searchsorted(sent_ids, tx_ids)
+            # We receive txs that we sent.
+            assert (index < len(sent_ids)).all()
+            assert (sent_ids[index] == tx_ids).all()
+            ids += [digest_ids]
+            times += [sent_times[index]]
+        return np.concatenate(ids), np.concatenate(times)
+
+    def _consensus_latency(self):
+        # NaN unless the payload was both proposed and committed.
+        latency = self.commit_times - self.proposal_times
+        return latency[~np.isnan(latency)]
+
+    def _end_to_end_latency(self):
+        return self.commit_times[self.sample_ids] - self.sample_times
+
+    def stage_latency(self):
+        ids = self.sample_ids
+        sealed, proposed = self.sealed_times[ids], self.proposal_times[ids]
+        known = ~np.isnan(sealed) & ~np.isnan(proposed)
+        sealed, proposed = sealed[known], proposed[known]
+        return {
+            'batching': sealed - self.sample_times[known],
+            'proposal': proposed - sealed,
+            'consensus': self.commit_times[ids[known]] - proposed,
+        }
+
+    def _node_latency(self, i):
+        lag = np.frombuffer(self.node_commits[i], dtype=float) - self.commit_times
+        lag = lag[~np.isnan(lag)]
+
+        proposals = self.node_proposals[i]
+        times = np.fromiter(proposals.values(), dtype=float, count=len(proposals))
+        latency = self.commit_times[self._ids(proposals.keys())] - times
+        return lag, latency[~np.isnan(latency)]
+
+    def timeline(self, window=1):
+        assert window > 0
+        if not self.commits:
+            return []
+
+        origin = min(self.start)
+        commit_times = self.commit_times[self.committed]
+        end = float(commit_times.max())
+        count = max(0, int((end - origin) // window)) + 1
+
+        def bucket(t):
+            buckets = np.floor_divide(t - origin, window).astype(np.int64)
+            return np.clip(buckets, 0, count - 1)
+
+        buckets = bucket(commit_times)
+        commits = np.bincount(buckets, minlength=count)
+        bytes = np.bincount(
+            buckets, weights=self.payload_sizes[self.committed], minlength=count
+        )
+
+        ends = self.commit_times[self.sample_ids]
+        buckets = bucket(ends)
+        order = np.argsort(buckets, kind='stable')
+        splits = np.cumsum(np.bincount(buckets, minlength=count))[:-1]
+        latency = np.split((ends - self.sample_times)[order], splits)
+
+        timeouts = np.array([x for y in self.timeout_times for x in y])
+        timeouts = np.bincount(bucket(timeouts), minlength=count)
+
+        return [{
+            'start': i * window,
+            'commits': int(commits[i]),
+            'bytes': int(bytes[i]),
+            'tps': int(bytes[i]) / self.size[0] / window,
+            'latency': self._mean(latency[i]),
+            'latency_p99': self._percentiles(latency[i])['p99'],
+            'timeouts': int(timeouts[i])
+        } for i in range(count)]
+
+    def _percentiles(self, latency):
+        if not len(latency):
+            return {k: 0 for k in PERCENTILES}
+        latency = np.sort(np.asarray(latency, dtype=float))
+        ranks = {
+            k: ceil(len(latency) * p / 100) - 1 for k, p in PERCENTILES.items()
+        }
+        return {k: float(latency[max(0, r)]) * 1000 for k, r in ranks.items()}
+
+    def _mean(self, latency):
+        if not len(latency):
+            return 0
+        return fsum(np.asarray(latency, dtype=float).tolist()) / len(latency) * 1000
@@ -0,0 +1,109 @@
+from json import dump
+
+from benchmark.config import Committee, ConfigError
+
+# One-way delays (ms) between the AWS regions of the default settings, about
+# half of the round-trip times measured between them.
+LATENCY = {
+    ('us-east-1', 'eu-north-1'): 55,
+    ('us-east-1', 'ap-southeast-2'): 100,
+    ('us-east-1', 'us-west-1'): 31,
+    ('us-east-1', 'ap-northeast-1'): 73,
+    ('eu-north-1', 'ap-southeast-2'): 145,
+    ('eu-north-1', 'us-west-1'): 85,
+    ('eu-north-1', 'ap-northeast-1'): 125,
+    ('ap-southeast-2', 'us-west-1'): 70,
+    ('ap-southeast-2', 'ap-northeast-1'): 53,
+    ('us-west-1', 'ap-northeast-1'): 53,
+}
+INTRA_REGION_LATENCY = 1  # ms
+
+
+class WanEmulator:
+    ''' Spread the nodes of a local committee over (emulated) regions and
+    route the traffic between them through relays that delay it as the WAN
+    would. The parameters are:
+        'regions': the regions, to which the nodes are assigned in turn,
+        'latency': one-way delays (ms) overriding the defaults, as a list
+            of [region, region, delay] triples,
+        'jitter' (ms), 'bandwidth' (Mb/s, per connection), and 'loss'. '''
+
+    def __init__(self, json, committee, port):
+        assert isinstance(json, dict)
+        assert isinstance(committee, Committee)
+        assert isinstance(port, int)
+        try:
+            regions = json.get('regions', sorted({x for y in LATENCY for x in y}))
+            self.latencies = dict(LATENCY)
+            for a, b, delay in json.get('latency', []):
+                self.latencies[(a, b)] = float(delay)
+            self.jitter = float(json.get('jitter', 0))
+            bandwidth = json.get('bandwidth')
+            self.bandwidth = float(bandwidth) if bandwidth else None
+            self.loss = float(json.get('loss', 0))
+        except (TypeError, ValueError):
+            raise ConfigError('Invalid WAN parameters')
+
+        if not regions:
+            raise ConfigError('The WAN emulation needs at least one region')
+        if self.jitter < 0 or not 0 <= self.loss < 1:
+            raise ConfigError('Invalid WAN jitter or loss')
+
+        self.committee = committee
+        size = committee.size()
+        self.regions = [regions[i % len(regions)] for i in range(size)]
+        for a in set(self.regions):
+            for b in set(self.regions):
+                self.latency(a, b)  # Check that all delays are known.
+
+        # Every node reaches every other node through its own relay ports
+        # (one for the consensus and one for the mempool).
+        self.ports = {
+            (i, j, k): port + 2 * (i * size + j) + k
+            for i in range(size) for j in range(size) for k in range(2)
+            if i != j
+        }
+
+    def latency(self, a, b):
+        if a == b:
+            return INTRA_REGION_LATENCY
+        for key in [(a, b), (b, a)]:
+            if key in self.latencies:
+                return self.latencies[key]
+        raise ConfigError(f'Unknown latency between {a} and {b}')
+
+    def _committee(self, i):
+        # The committee as seen by node i: its own addresses are the real
+        # ones (it binds them), the others point to the relays.
+        consensus, mempool = list(self.committee.consensus), \
+            list(self.committee.mempool)
+        for j in range(self.committee.size()):
+            if j != i:
+                consensus[j] = f'127.0.0.1:{self.ports[(i, j, 0)]}'
+                mempool[j] = f'127.0.0.1:{self.ports[(i, j, 1)]}'
+        return Committee(
+            self.committee.names, consensus, self.committee.front, mempool
+        )
+
+    def links(self):
+        links = []
+        for (i, j, k), port in sorted(self.ports.items()):
+            target = self.committee.consensus[j] if k == 0 \
+                else self.committee.mempool[j]
+            links += [{
+                'port': port,
+                'target': target,
+                'delay': self.latency(self.regions[i], self.regions[j]),
+                'jitter': self.jitter,
+                'bandwidth': self.bandwidth,
+                'loss': self.loss,
+            }]
+        return links
+
+    def print(self, committee_files, relay_file):
+        assert len(committee_files) == self.committee.size()
+        assert isinstance(relay_file, str)
+        for i, filename in enumerate(committee_files):
+            self._committee(i).print(filename)
+        with open(relay_file, 'w') as f:
+            dump({'links': self.links()}, f, indent=4)
@@ -1,16 +1,39 @@
+import os
+import subprocess
+from time import time
+
 from fabric import task
 
+from benchmark.commands import CommandMaker
+from benchmark.database import DatabaseError, ResultsDB
 from benchmark.local import LocalBench
 from benchmark.logs import ParseError, LogParser
-from benchmark.utils import Print
+from benchmark.mock import MockBench
+from benchmark.records import RecordError, RunRecords
+from benchmark.timestamps import TimestampDecoder
+from benchmark.utils import Print, PathMaker
 from benchmark.plot import Ploter, PlotError
 from aws.instance import InstanceManager
 from aws.remote import Bench, BenchError
 
 
+def _nodes(indices):
+    # Parse a comma-separated list of node indices, eg. "0,2".
+    return [int(x) for x in indices.split(',') if x.strip()]
+
+
+def _numpy_parser():
+    # NumPy is optional: only the vectorized parser needs it.
+    try:
+        from benchmark.vectorized import NumpyLogParser
+    except ImportError as e:
+        raise BenchError('The NumPy parser requires numpy', e)
+    return NumpyLogParser
+
+
 @task
-def local(ctx):
-    ''' Run benchmarks on localhost '''
+def local(ctx, profile='', live=False):
+    ''' Run benchmarks on localhost (profile: nodes to profile, eg. "0,1") '''
     bench_params = {
         'nodes': 4,
         'rate': 1_000,
@@ -33,12 +56,160 @@ def local(ctx):
         }
     }
     try:
-        ret = LocalBench(bench_params, node_params).run(debug=False).result()
-        print(ret)
+        parsers = LocalBench(bench_params, node_params).run(
+            debug=False, profile=_nodes(profile), live=live
+        )
+        for parser in parsers:
+            print(parser.result())
     except BenchError as e:
         Print.error(e)
 
 
+@task
+def parallel(ctx, testbeds=2, pin=False):
+    ''' Run several local testbeds side by side (pin: split the CPUs among them) '''
+    bench_params = {
+        'nodes': 4,
+        'rate': 1_000,
+        'tx_size': 512,
+        'faults': 0,
+        'duration': 20,
+    }
+    node_params = {
+        'consensus': {
+            'timeout_delay': 1_000,
+            'sync_retry_delay': 10_000,
+            'max_payload_size': 500,
+            'min_block_delay': 0
+        },
+        'mempool': {
+            'queue_capacity': 10_000,
+            'sync_retry_delay': 100_000,
+            'max_payload_size': 15_000,
+            'min_block_delay': 0
+        }
+    }
+    share = (os.cpu_count() or 1) // testbeds
+    try:
+        benches = [
+            LocalBench(
+                bench_params, node_params, testbed=i,
+                cpus=f'{i * share}-{(i + 1) * share - 1}' if pin and share else None
+            )
+            for i in range(testbeds)
+        ]
+        for i, ret in enumerate(LocalBench.run_parallel(benches)):
+            Print.heading(f'Testbed {i}')
+            if isinstance(ret, BenchError):
+                Print.error(ret)
+                continue
+            for parser in ret:
+                print(parser.result())
+    except BenchError as e:
+        Print.error(e)
+
+
+@task
+def mock(ctx, nodes=4, rate=1_000, duration=20, faults=0, timeouts=0, latency=10):
+    ''' Parse the logs of a simulated run (eg. to test or benchmark the parser) '''
+    bench_params = {
+        'nodes': int(nodes),
+        'rate': int(rate),
+        'tx_size': 512,
+        'faults': int(faults),
+        'duration': int(duration),
+    }
+    node_params = {
+        'consensus': {
+            'timeout_delay': 1_000,
+            'sync_retry_delay': 10_000,
+            'max_payload_size': 500,
+            'min_block_delay': 0
+        },
+        'mempool': {
+            'queue_capacity': 10_000,
+            'sync_retry_delay': 100_000,
+            'max_payload_size': 15_000,
+            'min_block_delay': 0
+        }
+    }
+    try:
+        subprocess.run(
+            [CommandMaker.clean_logs()], shell=True, stderr=subprocess.DEVNULL
+        )
+        MockBench(
+            bench_params, node_params, latency=float(latency),
+            timeouts=int(timeouts)
+        ).print(PathMaker.logs_path())
+        print(LogParser.process(PathMaker.logs_path(), faults=int(faults)).result())
+    except BenchError as e:
+        Print.error(e)
+    except ParseError as e:
+        Print.error(BenchError('Failed to parse logs', e))
+
+
+@task
+def parsebench(ctx, nodes=4, rate=100_000, duration=60):
+    ''' Compare the Python and NumPy log parsers on the logs of a simulated run '''
+    bench_params = {
+        'nodes': int(nodes),
+        'rate': int(rate),
+        'tx_size': 512,
+        'faults': 0,
+        'duration': int(duration),
+    }
+    node_params = {
+        'consensus': {
+            'timeout_delay': 1_000,
+            'sync_retry_delay': 10_000,
+            'max_payload_size': 50_000,
+            'min_block_delay': 0
+        },
+        'mempool': {
+            'queue_capacity': 10_000,
+            'sync_retry_delay': 100_000,
+            'max_payload_size': 15_000,
+            'min_block_delay': 0
+        }
+    }
+    try:
+        subprocess.run(
+            [CommandMaker.clean_logs()], shell=True, stderr=subprocess.DEVNULL
+        )
+        MockBench(bench_params, node_params).print(PathMaker.logs_path())
+        summaries = []
+        for parser in [LogParser, _numpy_parser()]:
+            start = time()
+            instance = parser.process(PathMaker.logs_path())
+            parsed = time()
+            summaries += [instance.result()]
+            Print.info(
+                f'{parser.__name__}: parsing {parsed - start:,.2f} s, '
+                f'metrics {time() - parsed:,.2f} s'
+            )
+        if summaries[0] != summaries[1]:
+            Print.warn('The summaries of the two parsers differ')
+
+        # Check the timestamp decoder against the reference decoding.
+        with open(PathMaker.node_log_file(0), 'r') as f:
+            timestamps = [x[1:x.index(' ')] for x in f]
+        start = time()
+        [TimestampDecoder.reference(x) for x in timestamps]
+        decoded = time()
+        TimestampDecoder().decode_all(timestamps)
+        end = time()
+        errors = TimestampDecoder().validate(timestamps)
+        Print.info(
+            f'Timestamps: reference {decoded - start:,.2f} s, '
+            f'decoder {end - decoded:,.2f} s '
+            f'({len(timestamps):,} timestamps, {len(errors):,} mismatches)'
+        )
+    except BenchError as e:
+        Print.error(e)
+    except ParseError as e:
+        Print.error(BenchError('Failed to parse logs', e))
+
+
 @task
 def create(ctx, nodes=2):
     ''' Create a testbed'''
@@ -94,8 +265,8 @@ def install(ctx):
 
 
 @task
-def remote(ctx):
-    ''' Run benchmarks on AWS '''
+def remote(ctx, build='remote', profile='', live=False):
+    ''' Run benchmarks on AWS (build: remote, local, or builder; profile: nodes to profile) '''
     bench_params = {
         'nodes': [10, 20],
         'rate': [25_000, 50_000],
@@ -119,14 +290,17 @@ def remote(ctx):
         }
     }
     try:
-        Bench(ctx).run(bench_params, node_params, debug=False)
+        Bench(ctx).run(
+            bench_params, node_params, debug=False, build=build,
+            profile=_nodes(profile), live=live
+        )
     except BenchError as e:
         Print.error(e)
 
 
 @task
 def plot(ctx):
-    ''' Plot performance using the logs generated by "fab remote" '''
+    ''' Plot performance using the results of "fab local" and "fab remote" '''
     plot_params = {
         'nodes': [10, 20],
         'tx_size': 512,
@@ -139,6 +313,33 @@ def plot(ctx):
         Print.error(BenchError('Failed to plot performance', e))
 
 
+@task
+def export(ctx, filename='results/runs.parquet'):
+    ''' Export the records of all runs as Parquet (requires pyarrow) or JSON lines (.jsonl) '''
+    try:
+        with ResultsDB(PathMaker.results_db()) as db:
+            records = db.records()
+        if filename.endswith('.jsonl'):
+            RunRecords(filename).write(records)
+        else:
+            RunRecords.export(records, filename)
+        Print.info(f'Exported {len(records):,} run(s) to {filename}')
+    except (DatabaseError, RecordError) as e:
+        Print.error(BenchError('Failed to export records', e))
+
+
+@task
+def timeline(ctx, window=1):
+    ''' Plot throughput and latency over time using the logs '''
+    try:
+        parser = LogParser.process('./logs')
+        Ploter.plot_timeline(parser.timeline(float(window)))
+    except ParseError as e:
+        Print.error(BenchError('Failed to parse logs', e))
+    except PlotError as e:
+        Print.error(BenchError('Failed to plot timeline', e))
+
+
 @task
 def kill(ctx):
     ''' Stop any HotStuff execution on all machines '''
@@ -149,9 +350,12 @@ def kill(ctx):
 
 
 @task
-def logs(ctx):
+def logs(ctx, numpy=False, cache=True):
     ''' Print a summary of the logs '''
     try:
-        print(LogParser.process('./logs').result())
+        parser = _numpy_parser() if numpy else LogParser
+        print(parser.process('./logs', cache=cache).result())
+    except BenchError as e:
+        Print.error(e)
     except ParseError as e:
         Print.error(BenchError('Failed to parse logs', e))
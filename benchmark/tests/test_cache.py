@@ -0,0 +1,68 @@
+import os
+
+from benchmark.cache import ParseCache
+from benchmark.logs import LogParser
+from tests.test_logs import mock_logs
+
+
+def write(filename, text, mtime=None):
+    with open(filename, 'w') as f:
+        f.write(text)
+    if mtime is not None:
+        os.utime(filename, (mtime, mtime))
+    return str(filename)
+
+
+def test_key_follows_the_contents(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    a = write(tmp_path / 'a.log', 'some logs', mtime=1_000)
+    b = write(tmp_path / 'b.log', 'some logs')
+
+    key = cache.key('nodes', a)
+    assert key.startswith('nodes-')
+    assert cache.key('nodes', b) == key  # Same contents, other path.
+    assert cache.key('clients', a) != key
+
+    # The file is hashed again once its size or mtime changed.
+    write(a, 'other logs', mtime=1_000)
+    assert cache.key('nodes', a) != key
+
+
+def test_entries_survive_a_reload(tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = ParseCache(directory)
+    key = cache.key('nodes', write(tmp_path / 'a.log', 'some logs'))
+    assert cache.get(key) is None
+    cache.put(key, {'rounds': [1, 2, 3]})
+    cache.save()
+
+    assert ParseCache(directory).get(key) == {'rounds': [1, 2, 3]}
+
+
+def test_eviction_drops_the_least_recently_used(tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = ParseCache(directory)
+    keys = [
+        cache.key('nodes', write(tmp_path / f'{i}.log', f'logs {i}'))
+        for i in range(3)
+    ]
+    for key in keys:
+        cache.put(key, bytes(1_000))
+    cache.index['entries'][keys[0]]['used'] += 10  # Read it again.
+    cache.max_size = 2 * cache.index['entries'][keys[0]]['size']
+    cache.save()
+
+    cache = ParseCache(directory)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert len(os.listdir(directory)) == 3  # The index and two entries.
+    assert str(tmp_path / '1.log') not in cache.index['paths']
+
+
+def test_cached_parse_matches(tmp_path, monkeypatch):
+    expected = mock_logs(tmp_path / 'logs').result()
+    monkeypatch.chdir(tmp_path)
+    for _ in range(2):  # Fill the cache, then read it.
+        parser = LogParser.process('logs', cache=True)
+        assert parser.result() == expected
+    assert os.listdir(tmp_path / '.parse-cache')
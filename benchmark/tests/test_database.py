@@ -0,0 +1,28 @@
+from benchmark.database import ResultsDB
+from benchmark.logs import LogParser
+from benchmark.records import RunRecords
+from tests.test_logs import mock_logs
+
+
+def test_records_round_trip(tmp_path):
+    parser = mock_logs(tmp_path / 'logs', faults=1, timeouts=2)
+    record = parser.record()
+    with ResultsDB(str(tmp_path / 'results.db')) as db:
+        db.insert_record(record)
+    with ResultsDB(str(tmp_path / 'results.db')) as db:
+        records = db.records()
+        assert db.records(nodes=4, faults=[0, 1]) == records
+        assert db.records(faults=0) == []
+
+    # The summary rendered from the stored record is that of the run.
+    assert len(records) == 1
+    assert LogParser.render(records[0]) == LogParser.render(record)
+    assert records[0]['setup'] == record['setup']
+    assert records[0]['commit_hash'] == record['commit_hash']
+
+    # And so is the one of the exported records.
+    filename = str(tmp_path / 'runs.jsonl')
+    RunRecords(filename).write(records)
+    exported = RunRecords(filename).load()
+    assert exported == records
+    assert LogParser.render(exported[0]) == LogParser.render(record)
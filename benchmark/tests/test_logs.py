@@ -0,0 +1,110 @@
+import pytest
+
+from benchmark.logs import PERCENTILES, LogParser
+from benchmark.mock import MockBench
+
+NODE_PARAMETERS = {
+    'consensus': {
+        'timeout_delay': 3_000,
+        'sync_retry_delay': 10_000,
+        'max_payload_size': 500,
+        'min_block_delay': 0
+    },
+    'mempool': {
+        'queue_capacity': 10_000,
+        'sync_retry_delay': 100_000,
+        'max_payload_size': 15_000,
+        'min_block_delay': 0
+    }
+}
+
+
+def mock_logs(directory, rate=1_000, duration=30, faults=0, timeouts=0, seed=3):
+    bench_parameters = {
+        'nodes': 4,
+        'rate': rate,
+        'tx_size': 512,
+        'faults': faults,
+        'duration': duration,
+    }
+    MockBench(
+        bench_parameters, NODE_PARAMETERS, timeouts=timeouts, seed=seed
+    ).print(str(directory))
+    return LogParser.process(str(directory), faults=faults)
+
+
+def test_view_changes_measure_the_stalls(tmp_path):
+    parser = mock_logs(tmp_path, timeouts=4)
+    report = parser.metrics()['view_change_report']
+
+    assert report['view_changes'] > 0
+    assert report['stall_time'] > 0
+    for event in report['events']:
+        # The throughput drops to zero during each stall.
+        assert event['recovery'] > 0
+        assert event['lost_tx'] > 0
+    assert report['lost_tx'] > 0
+
+
+@pytest.fixture(scope='module')
+def logs(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('logs')
+    mock_logs(directory)
+    return str(directory)
+
+
+def test_percentiles_use_the_nearest_rank(logs):
+    parser = LogParser.process(logs)
+    percentiles = parser._percentiles([x / 1000 for x in range(1_000, 0, -1)])
+    assert percentiles == pytest.approx(
+        {'p50': 500, 'p90': 900, 'p99': 990, 'p99.9': 999, 'max': 1_000}
+    )
+    assert parser._percentiles([]) == {k: 0 for k in PERCENTILES}
+
+
+def test_metrics_match_the_mock(logs):
+    metrics = LogParser.process(logs).metrics()
+
+    # The committee keeps up with the input rate.
+    assert metrics['input_rate'] == 1_000
+    assert metrics['end_to_end_tps'] == pytest.approx(1_000, rel=0.1)
+    assert metrics['view_change_report']['view_changes'] == 0
+    for name in ['consensus_percentiles', 'end_to_end_percentiles']:
+        values = list(metrics[name].values())
+        assert 0 < values[0] and values == sorted(values)
+    assert metrics['consensus_latency'] <= metrics['end_to_end_latency']
+
+
+def test_steady_state_trims_the_warm_up_and_cool_down(logs):
+    parser = LogParser.process(logs)
+    timeline = [
+        {'start': i, 'tps': x} for i, x in enumerate([0, 10, 90, 100, 110, 20])
+    ]
+    assert parser._steady_state(timeline) == (100, 2, 3)
+
+    metrics = parser.metrics()
+    assert metrics['steady_state_tps'] == pytest.approx(1_000, rel=0.1)
+    assert 0 <= metrics['steady_state_start'] < metrics['steady_state_end']
+    assert metrics['steady_state_end'] <= metrics['duration'] + 1
+
+
+def test_numpy_parser_matches(logs):
+    pytest.importorskip('numpy')
+    from benchmark.vectorized import NumpyLogParser
+
+    expected = LogParser.process(logs).metrics()
+    metrics = NumpyLogParser.process(logs).metrics()
+    for key in ['resources', 'placement', 'profiles']:
+        expected.pop(key), metrics.pop(key)
+    assert _close(metrics, expected)
+
+
+def _close(a, b):
+    # pytest.approx does not compare nested structures.
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_close(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_close(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return a == pytest.approx(b)
+    return a == b
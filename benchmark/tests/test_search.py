@@ -0,0 +1,45 @@
+from benchmark.search import SaturationSearch
+
+
+def system(capacity, offered_share=1):
+    # A fake probe: the clients offer a share of the input rate (the others
+    # are faulty), and the system commits up to its capacity.
+    def probe(rate):
+        offered = rate * offered_share
+        tps = min(offered, capacity)
+        latency = 100 if offered <= capacity else 10_000
+        return [{
+            'input_rate': offered,
+            'end_to_end_tps': tps,
+            'end_to_end_latency': latency
+        }]
+    return probe
+
+
+def test_search_finds_the_capacity():
+    search = SaturationSearch(1_000, max_latency=1_000, tolerance=500)
+    rate, tps = search.run(system(50_000))
+    assert 50_000 - 500 <= rate <= 50_000
+    assert tps == rate
+
+
+def test_search_with_faults_compares_with_the_offered_rate():
+    # One of four nodes is faulty, so its client does not run.
+    search = SaturationSearch(1_000, max_latency=1_000, tolerance=500)
+    best = search.run(system(30_000, offered_share=3 / 4))
+    assert best is not None
+    assert 30_000 - 500 <= best[1] <= 30_000
+
+
+def test_search_aborts_when_the_benchmark_fails():
+    calls = []
+
+    def probe(rate):
+        calls.append(rate)
+        return []
+
+    search = SaturationSearch(1_000, max_latency=1_000, tolerance=500)
+    assert search.run(probe) is None
+    # The failed probe is retried once at the same rate, not bisected.
+    assert calls == [1_000] * (SaturationSearch.MAX_RETRIES + 1)
+    assert search.probes == []